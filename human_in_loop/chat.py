@@ -1,23 +1,37 @@
 # ------------------------------
 # 1. 核心依赖导入
 # ------------------------------
-from typing import TypedDict, Literal
+from typing import Any, Callable, TypedDict, Literal, NotRequired
+import asyncio
+import functools
+import inspect
+import sys
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import json  # 新增：替换eval，安全解析JSON
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
 from langgraph.types import interrupt, Command, Interrupt  # 显式导入Interrupt类型
 
+from human_in_loop.review_policy import ReviewPolicy
+from human_in_loop.tool_cache import ToolResultCache
+from langgraph_checkpoint.sqlite_saver import SqliteSaver
+
 
 # ------------------------------
 # 2. 定义图状态（存储工具调用全流程数据）
 # ------------------------------
 class ToolReviewState(TypedDict):
     tool_calls: list[dict]
-    human_approval: Literal["approve", "modify", "reject"] | None
+    # cached：所有工具调用都命中了可以跳过审查的缓存，没有经过人工审查
+    # auto_approve/auto_reject：审查策略自动批准/拒绝，没有经过人工审查
+    human_approval: Literal["approve", "modify", "reject", "cached", "auto_approve", "auto_reject"] | None
     human_modified_tool_calls: list[dict] | None
     tool_exec_result: str | None
+    # 每个工具调用的执行结果（与tool_calls顺序一致）：{"name", "params", "status", "detail", "latency_ms", "cached"(命中缓存时)}
+    tool_exec_results: NotRequired[list[dict] | None]
 
 
 # ------------------------------
@@ -47,6 +61,40 @@ def llm_suggest_tool(state: ToolReviewState) -> ToolReviewState:
 
 
 
+def auto_review(state: ToolReviewState, config: RunnableConfig) -> Command[
+        Literal["execute_tool", "human_review_tool", "end"]]:
+    """
+    人工审查前的自动审查，能自动决定的调用不挂起线程：
+    1. 所有工具调用都有可以跳过审查的缓存结果时，直接使用缓存结果结束流程（不经过execute_tool，
+       否则缓存在两次查询之间过期时工具会未经审查直接执行）
+    2. 按审查策略自动批准或拒绝
+    其他调用交给human_review_tool。
+    放在单独的节点中，human_review_tool被恢复时重新执行不会再次判断（否则缓存或限流状态变化后可能忽略人工的决定）
+    """
+    cached = tool_cache.review_skip_results(state["tool_calls"])
+    if cached is not None:
+        start = time.perf_counter()
+        results = [{**_tool_result(tool, "ok", result, start), "cached": True}
+                   for tool, result in zip(state["tool_calls"], cached)]
+        print("✅ 命中缓存，跳过人工审查")
+        return Command(goto="end", update={**_exec_update(state, results), "human_approval": "cached"})
+    user = config["configurable"].get("user_id", "anonymous")
+    action, reason = review_policy.evaluate(state["tool_calls"], user=user)
+    if action == "approve":
+        print(f"✅ 审查策略自动批准：{reason}")
+        return Command(goto="execute_tool", update={"human_approval": "auto_approve"})
+    if action == "reject":
+        print(f"❌ 审查策略自动拒绝：{reason}")
+        return Command(
+            goto="end",
+            update={
+                "human_approval": "auto_reject",
+                "tool_exec_result": f"❌ 工具未执行（策略拒绝：{reason}）"
+            }
+        )
+    return Command(goto="human_review_tool")
+
+
 def human_review_tool(state: ToolReviewState) -> Command[Literal["execute_tool", "end"]]:
     """人类审查工具调用（核心 interrupt 节点）"""
     # 调用 interrupt：向用户传递审查信息
@@ -56,6 +104,8 @@ def human_review_tool(state: ToolReviewState) -> Command[Literal["execute_tool",
             "审查任务": "请确认是否允许执行以下工具调用",
             "待审查工具": state["tool_calls"][0]["name"],
             "待审查参数": state["tool_calls"][0]["params"],
+            # 批准后会并发执行所有工具调用
+            "全部工具调用": state["tool_calls"],
             "可选操作": {
                 "approve": "批准执行（直接运行工具）",
                 "reject": "拒绝执行（流程终止）",
@@ -105,46 +155,189 @@ def human_review_tool(state: ToolReviewState) -> Command[Literal["execute_tool",
         raise ValueError(f"❌ 无效操作：{user_raw_input}，仅支持 approve/reject/modify")
 
 
-def execute_tool(state: ToolReviewState) -> ToolReviewState:
-    """执行工具调用（仅在用户批准/修改后触发）"""
-    tool = state["tool_calls"][0]
-    tool_name = tool["name"]
-    tool_params = tool["params"]
+# ------------------------------
+# 工具注册表：同步工具在线程池中执行，异步工具（async def）在事件循环中执行
+# ------------------------------
+def get_weather(city: str, date: str, unit: str = "celsius") -> str:
+    """模拟天气查询工具（真实场景替换为实际接口）"""
+    return f"{city} {date} 的天气为 25℃，晴"
+
+
+tool_registry: dict[str, Callable[..., Any]] = {
+    "get_weather": get_weather,
+}
+# 每个工具的超时时间（秒），未配置的使用默认超时
+tool_timeouts: dict[str, float] = {}
+default_tool_timeout = 10.0
+# 审查策略：缺省没有规则，所有调用都人工审查；自动审查见review_policy.example_policy
+review_policy = ReviewPolicy()
+# 工具结果缓存：get_weather命中缓存时仍需审查，只跳过执行
+tool_cache = ToolResultCache(modes={"get_weather": "execute"}, max_entries=1024, ttl=300)
+_tool_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="tool")
 
-    print(f"🔧 开始执行工具：{tool_name}")
-    print(f"   执行参数：{tool_params}")
+
+def _timeout_for(tool_name: str) -> float:
+    return tool_timeouts.get(tool_name, default_tool_timeout)
+
+
+def _tool_result(tool: dict, status: str, detail: str, start: float) -> dict:
+    """
+    单个工具调用的结果
+    :param status: ok | error | timeout
+    :param detail: 执行结果或错误信息
+    :return:
+    """
+    return {"name": tool.get("name"), "params": tool.get("params"), "status": status, "detail": detail,
+            "latency_ms": (time.perf_counter() - start) * 1000}
+
+
+async def _arun_one(tool: dict) -> dict:
+    start = time.perf_counter()
+    func = tool_registry.get(tool.get("name"))
+    if func is None:
+        return _tool_result(tool, "error", f"未知工具 {tool.get('name')}", start)
     try:
-        if tool_name == "get_weather":
-            exec_result = f"✅ 工具执行成功：{tool_params['city']} {tool_params['date']} 的天气为 25℃，晴"
+        params = tool.get("params") or {}
+        if inspect.iscoroutinefunction(func):
+            call = func(**params)
         else:
-            exec_result = f"❌ 工具执行失败：未知工具 {tool_name}"
+            call = asyncio.get_running_loop().run_in_executor(_tool_pool, functools.partial(func, **params))
+        result = await asyncio.wait_for(call, timeout=_timeout_for(tool["name"]))
+        return _tool_result(tool, "ok", str(result), start)
+    except asyncio.TimeoutError:
+        return _tool_result(tool, "timeout", f"超过 {_timeout_for(tool['name'])}s 未返回", start)
     except Exception as e:
-        exec_result = f"❌ 工具执行异常：{str(e)}"
+        return _tool_result(tool, "error", str(e), start)
+
+
+async def arun_tool_calls(tool_calls: list[dict]) -> list[dict]:
+    """
+    并发执行所有工具调用，总耗时取决于最慢的工具而不是所有工具耗时之和
+    :param tool_calls: [{"name", "params"}]
+    :return: 与tool_calls顺序一致的结果列表，单个工具失败或超时不影响其他工具
+    """
+    return list(await asyncio.gather(*(_arun_one(tool) for tool in tool_calls)))
 
+
+def _call_in_thread(func: Callable[..., Any], params: dict) -> Any:
+    """在线程池中执行工具，异步工具在该线程中用asyncio.run执行"""
+    if inspect.iscoroutinefunction(func):
+        return asyncio.run(func(**params))
+    return func(**params)
+
+
+def run_tool_calls(tool_calls: list[dict]) -> list[dict]:
+    """arun_tool_calls的同步版本：所有工具同时提交到线程池执行"""
+    start = time.perf_counter()
+    futures = []
+    for tool in tool_calls:
+        func = tool_registry.get(tool.get("name"))
+        futures.append(None if func is None else
+                       _tool_pool.submit(_call_in_thread, func, tool.get("params") or {}))
+
+    results = []
+    for tool, future in zip(tool_calls, futures):
+        if future is None:
+            results.append(_tool_result(tool, "error", f"未知工具 {tool.get('name')}", start))
+            continue
+        # 所有工具同时开始执行，按各自的截止时间等待
+        remaining = max(0.0, start + _timeout_for(tool["name"]) - time.perf_counter())
+        try:
+            results.append(_tool_result(tool, "ok", str(future.result(timeout=remaining)), start))
+        except FutureTimeoutError:
+            # 线程无法被强制终止，超时的工具在后台执行完后结果被丢弃
+            future.cancel()
+            results.append(_tool_result(tool, "timeout", f"超过 {_timeout_for(tool['name'])}s 未返回", start))
+        except Exception as e:
+            results.append(_tool_result(tool, "error", str(e), start))
+    return results
+
+
+def _format_results(results: list[dict]) -> str:
+    lines = []
+    for result in results:
+        if result["status"] == "ok":
+            lines.append(f"✅ 工具执行成功：{result['detail']}")
+        elif result["status"] == "timeout":
+            lines.append(f"❌ 工具执行超时：{result['name']} {result['detail']}")
+        elif result["detail"].startswith("未知工具"):
+            lines.append(f"❌ 工具执行失败：{result['detail']}")
+        else:
+            lines.append(f"❌ 工具执行异常：{result['detail']}")
+    failed = sum(result["status"] != "ok" for result in results)
+    if len(results) > 1 and failed:
+        lines.append(f"⚠️ 部分工具执行失败：{failed}/{len(results)}")
+    return "\n".join(lines)
+
+
+def _print_tool_calls(tool_calls: list[dict]):
+    for tool in tool_calls:
+        print(f"🔧 开始执行工具：{tool.get('name')}")
+        print(f"   执行参数：{tool.get('params')}")
+
+
+def _split_cached(tool_calls: list[dict]) -> tuple[list[dict | None], list[dict]]:
+    """
+    :return: (与tool_calls顺序一致的缓存结果，未命中时为None; 需要执行的工具调用)
+    """
+    cached = []
+    for tool in tool_calls:
+        start = time.perf_counter()
+        result = tool_cache.get(tool)
+        cached.append(None if result is None else {**_tool_result(tool, "ok", result, start), "cached": True})
+    return cached, [tool for tool, result in zip(tool_calls, cached) if result is None]
+
+
+def _merge_cached(cached: list[dict | None], executed: list[dict]) -> list[dict]:
+    """按原顺序合并缓存结果和执行结果，并缓存执行成功的结果"""
+    for result in executed:
+        if result["status"] == "ok":
+            tool_cache.put(result, result["detail"])
+    executed_iter = iter(executed)
+    return [result if result is not None else next(executed_iter) for result in cached]
+
+
+def _exec_update(state: ToolReviewState, results: list[dict]) -> ToolReviewState:
+    exec_result = _format_results(results)
     print(f"   执行结果：{exec_result}\n")
-    return {**state, "tool_exec_result": exec_result}
+    return {**state, "tool_exec_result": exec_result, "tool_exec_results": results}
+
+
+def execute_tool(state: ToolReviewState) -> ToolReviewState:
+    """执行所有工具调用（仅在用户批准/修改后触发），多个工具并发执行"""
+    _print_tool_calls(state["tool_calls"])
+    cached, pending = _split_cached(state["tool_calls"])
+    return _exec_update(state, _merge_cached(cached, run_tool_calls(pending)))
+
+
+async def aexecute_tool(state: ToolReviewState) -> ToolReviewState:
+    """execute_tool的异步版本，graph.ainvoke/astream时使用"""
+    _print_tool_calls(state["tool_calls"])
+    cached, pending = _split_cached(state["tool_calls"])
+    return _exec_update(state, _merge_cached(cached, await arun_tool_calls(pending)))
 
 
 # ------------------------------
 # 4. 构建 LangGraph 图
 # ------------------------------
-def build_tool_review_graph() -> StateGraph:
+def build_tool_review_graph(db_path: str = "tool_review.db") -> StateGraph:
     graph_builder = StateGraph(ToolReviewState)
 
     # 添加节点
     graph_builder.add_node("llm_suggest_tool", llm_suggest_tool)
+    graph_builder.add_node("auto_review", auto_review)
     graph_builder.add_node("human_review_tool", human_review_tool)
-    graph_builder.add_node("execute_tool", execute_tool)
+    graph_builder.add_node("execute_tool", RunnableLambda(execute_tool, afunc=aexecute_tool))
     graph_builder.add_node("end", lambda x: x)
 
     # 定义流向
     graph_builder.add_edge(START, "llm_suggest_tool")
-    graph_builder.add_edge("llm_suggest_tool", "human_review_tool")
+    graph_builder.add_edge("llm_suggest_tool", "auto_review")
     graph_builder.add_edge("execute_tool", "end")
     graph_builder.add_edge("end", END)
 
-    # 配置状态保存
-    checkpointer = MemorySaver()
+    # 配置状态保存：等待人工审查的线程保存在SQLite中，不占内存，进程重启后也可以继续恢复
+    checkpointer = SqliteSaver(db_path)
     graph = graph_builder.compile(
         checkpointer=checkpointer,
     )
@@ -162,34 +355,40 @@ if __name__ == "__main__":
     # 1. 构建图
     tool_review_graph: StateGraph = build_tool_review_graph()
 
-    # 2. 生成线程ID
-    thread_id = str(uuid.uuid4())
+    # 2. 生成线程ID：传入已有的线程ID时，直接恢复之前挂起的审查（例如进程重启后）
+    thread_id = sys.argv[1] if len(sys.argv) > 1 else str(uuid.uuid4())
     thread_config = {"configurable": {"thread_id": thread_id}}
 
-    # 3. 首次运行：触发 interrupt
-    print("🚀 首次运行：LLM 生成工具建议后，将暂停等待您的审查...\n")
-
     interrupt_obj = None
-    for chunk in tool_review_graph.stream(
-        input={
-            "tool_calls": [],
-            "human_approval": None,
-            "human_modified_tool_calls": None,
-            "tool_exec_result": None
-        },
-        config=thread_config
-    ):
-        print("chunk >>>", chunk)
-
-        # ✅ stream 产出通常是 (node_name, value)
-        if "__interrupt__" in chunk:
-            # 在新版本里，value 不在 chunk 里，而是在 state 里
-            interrupt_obj = chunk.get("__interrupt__")[0]
-            print("=" * 40)
-            print("⏸️ 流程已暂停：请进行工具审查")
-            print("=" * 40)
-            print("中断信息:", interrupt_obj)
-            print("=" * 40 + "\n")
+    pending_tasks = tool_review_graph.get_state(thread_config).tasks
+    if pending_tasks and pending_tasks[0].interrupts:
+        interrupt_obj = pending_tasks[0].interrupts[0]
+        print(f"♻️ 恢复挂起的审查，线程ID：{thread_id}")
+        print("中断信息:", interrupt_obj)
+    else:
+        # 3. 首次运行：触发 interrupt
+        print(f"🚀 首次运行（线程ID：{thread_id}）：LLM 生成工具建议后，将暂停等待您的审查...\n")
+
+        for chunk in tool_review_graph.stream(
+            input={
+                "tool_calls": [],
+                "human_approval": None,
+                "human_modified_tool_calls": None,
+                "tool_exec_result": None
+            },
+            config=thread_config
+        ):
+            print("chunk >>>", chunk)
+
+            # ✅ stream 产出通常是 (node_name, value)
+            if "__interrupt__" in chunk:
+                # 在新版本里，value 不在 chunk 里，而是在 state 里
+                interrupt_obj = chunk.get("__interrupt__")[0]
+                print("=" * 40)
+                print("⏸️ 流程已暂停：请进行工具审查")
+                print("=" * 40)
+                print("中断信息:", interrupt_obj)
+                print("=" * 40 + "\n")
 
 
     if interrupt_obj:
@@ -209,6 +408,16 @@ if __name__ == "__main__":
         print(f"用户审查结果：{final_state['human_approval']}")
         print(f"修改后的工具（若有）：{final_state['human_modified_tool_calls'] or '无'}")
         print(f"工具执行结果：{final_state['tool_exec_result']}")
+        print(f"工具结果缓存：{tool_cache.stats()}")
+        print(f"审查策略：{review_policy.stats()}")
         print("=" * 60)
     else:
-        raise RuntimeError("❌ 未捕获到中断，请检查配置")
+        # 审查策略或结果缓存自动完成了审查，流程没有暂停
+        final_state = tool_review_graph.get_state(thread_config).values
+        if final_state.get("human_approval") not in ("auto_approve", "auto_reject", "cached"):
+            raise RuntimeError("❌ 未捕获到中断，请检查配置")
+        print("\n" + "=" * 60)
+        print(f"📋 流程结束（未经人工审查）：{final_state['human_approval']}")
+        print(f"工具执行结果：{final_state['tool_exec_result']}")
+        print(f"审查策略：{review_policy.stats()}")
+        print("=" * 60)
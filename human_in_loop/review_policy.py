@@ -0,0 +1,133 @@
+"""
+工具调用审查策略：低风险的调用自动批准、明确禁止的调用自动拒绝，都不需要挂起线程等待人工审查，
+其他调用才交给人工审查（interrupt）。
+
+策略是按顺序匹配的规则列表，每条规则：
+{
+    "tool": "get_weather",                       # 工具名，支持通配符（fnmatch）
+    "params": {                                  # 可选，参数条件，所有条件都满足才匹配
+        "days": {"min": 1, "max": 7},            # 数值范围
+        "unit": {"in": ["celsius", "fahrenheit"]},
+        "city": {"not_in": ["Pyongyang"]},
+        "query": {"max_len": 100},               # 字符串/列表长度上限
+    },
+    "rate": {"max_calls": 30, "window": 60},     # 可选，每个用户window秒内最多自动批准max_calls个调用，超过后这条规则不再匹配
+    "action": "approve",                         # approve | reject | review
+    "reason": "...",                             # 可选，说明
+}
+没有规则匹配的调用交给人工审查。一次请求中的多个工具调用：任意一个被拒绝则全部拒绝，全部批准才自动批准，否则人工审查。
+缺省没有任何规则（所有调用都人工审查），需要自动审查时显式传入规则，例如ReviewPolicy(example_policy)
+"""
+import fnmatch
+import threading
+import time
+from collections import deque
+from typing import Literal
+
+PolicyAction = Literal["approve", "reject", "review"]
+
+# 示例策略（需要显式启用）：天气查询是只读的，参数合法时自动批准；删除类工具一律拒绝
+example_policy: list[dict] = [
+    {
+        "tool": "get_weather",
+        "params": {"unit": {"in": ["celsius", "fahrenheit"]}, "city": {"max_len": 64}},
+        "rate": {"max_calls": 30, "window": 60},
+        "action": "approve",
+        "reason": "只读的天气查询",
+    },
+    {"tool": "delete_*", "action": "reject", "reason": "禁止删除类操作"},
+]
+
+
+def _param_matches(value, condition: dict) -> bool:
+    try:
+        if "in" in condition and value not in condition["in"]:
+            return False
+        if "not_in" in condition and value in condition["not_in"]:
+            return False
+        if "min" in condition and (value is None or value < condition["min"]):
+            return False
+        if "max" in condition and (value is None or value > condition["max"]):
+            return False
+        if "max_len" in condition and (value is None or len(value) > condition["max_len"]):
+            return False
+    except TypeError:
+        # 类型不对（例如字符串和数字比较）视为不匹配
+        return False
+    return True
+
+
+class ReviewPolicy:
+    """按规则自动决定工具调用是否需要人工审查"""
+
+    def __init__(self, rules: list[dict] | None = None):
+        self.rules = list(rules or [])
+        self._lock = threading.Lock()
+        # (用户, 规则序号) -> 自动批准的时间戳
+        self._calls: dict[tuple[str, int], deque] = {}
+        self.evaluated = 0
+        self.auto_approved = 0
+        self.auto_rejected = 0
+        self.escalated = 0
+
+    def _within_rate(self, user: str, index: int, rate: dict, now: float, pending: int) -> bool:
+        """
+        :param pending: 同一次请求中已经匹配这条规则的调用数，每个调用都计入限额
+        """
+        calls = self._calls.get((user, index))
+        if calls is not None:
+            while calls and now - calls[0] > rate["window"]:
+                calls.popleft()
+            if not calls:
+                del self._calls[(user, index)]
+                calls = None
+        return (len(calls) if calls else 0) + pending < rate["max_calls"]
+
+    def _match(self, tool: dict, user: str, now: float, pending: dict[int, int]) -> tuple[int | None, dict | None]:
+        params = tool.get("params") or {}
+        for index, rule in enumerate(self.rules):
+            if not fnmatch.fnmatchcase(tool.get("name") or "", rule["tool"]):
+                continue
+            if not all(_param_matches(params.get(name), condition)
+                       for name, condition in rule.get("params", {}).items()):
+                continue
+            if "rate" in rule and not self._within_rate(user, index, rule["rate"], now, pending.get(index, 0)):
+                continue
+            pending[index] = pending.get(index, 0) + 1
+            return index, rule
+        return None, None
+
+    def evaluate(self, tool_calls: list[dict], user: str = "anonymous") -> tuple[PolicyAction, str]:
+        """
+        :param tool_calls: [{"name", "params"}]
+        :param user: 用户ID，用于按用户限流
+        :return: (approve | reject | review, 原因)
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.evaluated += 1
+            pending: dict[int, int] = {}
+            matched = [self._match(tool, user, now, pending) for tool in tool_calls]
+            for tool, (_, rule) in zip(tool_calls, matched):
+                if rule is not None and rule["action"] == "reject":
+                    self.auto_rejected += 1
+                    return "reject", f"{tool.get('name')}：{rule.get('reason', '策略拒绝')}"
+            if tool_calls and all(rule is not None and rule["action"] == "approve" for _, rule in matched):
+                for index, rule in matched:
+                    if "rate" in rule:
+                        self._calls.setdefault((user, index), deque()).append(now)
+                self.auto_approved += 1
+                return "approve", "；".join(rule.get("reason", "策略批准") for _, rule in matched)
+            self.escalated += 1
+            return "review", "需要人工审查"
+
+    def stats(self) -> dict:
+        with self._lock:
+            fast_path = self.auto_approved + self.auto_rejected
+            return {
+                "evaluated": self.evaluated,
+                "auto_approved": self.auto_approved,
+                "auto_rejected": self.auto_rejected,
+                "escalated": self.escalated,
+                "fast_path_ratio": fast_path / self.evaluated if self.evaluated else 0.0,
+            }
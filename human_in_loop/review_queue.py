@@ -0,0 +1,123 @@
+"""
+批量审查队列：
+1. 分页列出所有挂起在human_review_tool节点、等待人工审查的线程及其审查信息
+2. 一次提交多个approve/reject/modify决定，并发（有上限）恢复对应的图
+3. 统计每次恢复的耗时和队列深度
+
+依赖SqliteSaver按中断写入建立的索引（list_interrupts/count_interrupts）
+"""
+import asyncio
+import time
+
+from langgraph.types import Command
+
+from langgraph_checkpoint.sqlite_saver import SqliteSaver
+from multi_agent.stream_metrics import percentile
+
+
+class ReviewQueue:
+    """挂起在审查节点上的线程队列"""
+
+    def __init__(self, graph, node: str = "human_review_tool", max_parallel: int = 8):
+        if not isinstance(graph.checkpointer, SqliteSaver):
+            raise TypeError("ReviewQueue需要使用SqliteSaver作为checkpointer")
+        self.graph = graph
+        self.saver: SqliteSaver = graph.checkpointer
+        self.node = node
+        self.max_parallel = max_parallel
+        self.resumed = 0
+        self.failed = 0
+        self._latencies: list[float] = []
+
+    def depth(self) -> int:
+        """当前等待审查的线程数"""
+        return self.saver.count_interrupts(self.node)
+
+    def pending(self, page: int = 0, page_size: int = 50) -> list[dict]:
+        """
+        分页获取待审查的线程
+        :param page: 页码，从0开始
+        :param page_size:
+        :return: [{"thread_id", "payload"}]，payload是interrupt()传入的审查信息
+        """
+        items = self.saver.list_interrupts(self.node, limit=page_size, offset=page * page_size)
+        return [{"thread_id": item["thread_id"], "payload": [i.value for i in item["interrupts"]]} for item in items]
+
+    async def _resume_one(self, semaphore: asyncio.Semaphore, thread_id: str, decision: str) -> dict:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                final_state = await self.graph.ainvoke(
+                    Command(resume=decision), config={"configurable": {"thread_id": thread_id}}
+                )
+                status, detail = "ok", final_state.get("tool_exec_result")
+            except Exception as e:
+                status, detail = "error", str(e)
+            latency = time.perf_counter() - start
+        self._latencies.append(latency)
+        if status == "ok":
+            self.resumed += 1
+        else:
+            self.failed += 1
+        return {"thread_id": thread_id, "decision": decision, "status": status, "result": detail,
+                "latency_ms": latency * 1000}
+
+    async def aresume_many(self, decisions: dict[str, str]) -> dict:
+        """
+        并发恢复多个线程
+        :param decisions: {线程ID: "approve" | "reject" | "modify|[...]"}
+        :return: {"results": 每个线程的结果和耗时, "depth_before", "depth_after", "p50_ms", "p95_ms"}
+        """
+        depth_before = self.depth()
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        results = await asyncio.gather(*(self._resume_one(semaphore, thread_id, decision)
+                                         for thread_id, decision in decisions.items()))
+        latencies = sorted(result["latency_ms"] for result in results)
+        return {
+            "results": results,
+            "depth_before": depth_before,
+            "depth_after": self.depth(),
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+        }
+
+    def resume_many(self, decisions: dict[str, str]) -> dict:
+        """aresume_many的同步版本"""
+        return asyncio.run(self.aresume_many(decisions))
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+        return {
+            "depth": self.depth(),
+            "resumed": self.resumed,
+            "failed": self.failed,
+            "resume_p50_ms": percentile(latencies, 50) * 1000,
+            "resume_p95_ms": percentile(latencies, 95) * 1000,
+        }
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import uuid
+
+    from human_in_loop.chat import build_tool_review_graph, tool_cache
+
+    # 缺省的审查策略没有规则，所有调用都进入审查队列
+    graph = build_tool_review_graph()
+    queue = ReviewQueue(graph)
+    # 先制造一批待审查的线程
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(20):
+            graph.invoke({"tool_calls": [], "human_approval": None, "human_modified_tool_calls": None,
+                          "tool_exec_result": None}, config={"configurable": {"thread_id": str(uuid.uuid4())}})
+    print(f"待审查：{queue.depth()}")
+    page = queue.pending(page=0, page_size=10)
+    print(f"第一页：{[item['thread_id'] for item in page]}")
+    # 第一页全部批准
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary = queue.resume_many({item["thread_id"]: "approve" for item in page})
+    print(f"恢复前队列深度：{summary['depth_before']}，恢复后：{summary['depth_after']}，"
+          f"p50：{summary['p50_ms']:.1f}ms，p95：{summary['p95_ms']:.1f}ms")
+    print(queue.stats())
+    print(f"工具结果缓存：{tool_cache.stats()}")
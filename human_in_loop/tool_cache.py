@@ -0,0 +1,118 @@
+"""
+审查过的工具调用结果缓存：
+相同工具名和参数（参数顺序无关）的调用在ttl内直接使用上次的执行结果，按LRU淘汰。
+每个工具可以单独选择缓存命中时的行为：
+1. execute：仍然需要人工审查，只跳过工具执行
+2. review：跳过人工审查（不调用interrupt）和工具执行
+没有配置的工具不缓存
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Literal
+
+CacheMode = Literal["execute", "review"]
+
+
+def cache_key(tool_name: str, params: dict | None) -> str:
+    """工具名+排序后的参数的规范化哈希"""
+    canonical = json.dumps([tool_name, params or {}], sort_keys=True, ensure_ascii=False, separators=(",", ":"),
+                           default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ToolResultCache:
+    """TTL+LRU的工具结果缓存"""
+
+    def __init__(self, modes: dict[str, CacheMode] | None = None, max_entries: int = 1024, ttl: float = 300):
+        """
+        :param modes: 工具名 -> 缓存命中时的行为（execute | review）
+        :param max_entries: 最多缓存的结果数，超过后淘汰最久没有使用的结果
+        :param ttl: 结果的有效期（秒）
+        """
+        self.modes: dict[str, CacheMode] = dict(modes or {})
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (写入时间, 执行结果)
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.skipped_reviews = 0
+        self.evictions = 0
+
+    def cacheable(self, tool: dict) -> bool:
+        return tool.get("name") in self.modes
+
+    def _lookup(self, key: str) -> str | None:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        if time.monotonic() - item[0] > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return item[1]
+
+    def get(self, tool: dict) -> str | None:
+        """
+        查询缓存的执行结果，并计入命中/未命中统计
+        :param tool: {"name", "params"}
+        :return: 缓存的结果，未命中或该工具不缓存时返回None
+        """
+        if not self.cacheable(tool):
+            return None
+        with self._lock:
+            result = self._lookup(cache_key(tool["name"], tool.get("params")))
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result
+
+    def put(self, tool: dict, result: str):
+        """只缓存执行成功的结果"""
+        if not self.cacheable(tool):
+            return
+        with self._lock:
+            key = cache_key(tool["name"], tool.get("params"))
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def review_skip_results(self, tool_calls: list[dict]) -> list[str] | None:
+        """
+        所有工具调用都配置为review模式并且都有缓存结果时，可以跳过人工审查
+        :param tool_calls:
+        :return: 与tool_calls顺序一致的缓存结果，不能跳过审查时返回None。
+        调用方必须直接使用返回的结果，不能之后再查询缓存（期间结果可能过期或被淘汰，导致未经审查就执行工具）
+        """
+        if not tool_calls or any(self.modes.get(tool.get("name")) != "review" for tool in tool_calls):
+            return None
+        with self._lock:
+            results = [self._lookup(cache_key(tool["name"], tool.get("params"))) for tool in tool_calls]
+            if any(result is None for result in results):
+                return None
+            self.skipped_reviews += 1
+            self.hits += len(results)
+            return results
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "skipped_reviews": self.skipped_reviews,
+                "evictions": self.evictions,
+            }
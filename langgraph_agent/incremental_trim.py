@@ -0,0 +1,211 @@
+"""
+增量计算token的消息裁剪，用来替换pre_model_hook中的trim_messages：
+trim_messages每次调用模型前都要对全部历史消息重新计算token（二分查找时还会重复计算多次），
+每轮是O(历史长度)，整个会话是O(n²)。
+IncrementalTrimmer：
+1. 按消息ID缓存每条消息的token数，每轮只计算新增的消息
+2. 每个会话维护token数的前缀和，任意后缀的token数 = 前缀和之差
+3. 用二分查找在O(log n)内找到裁剪边界
+结果与trim_messages(strategy="last", start_on=..., end_on=...)一致（不支持allow_partial和include_system），
+token_counter必须可以按消息累加（count_tokens_approximately满足）。
+和add_messages一样以消息ID识别消息：追加和删除消息都能检测到，但同一个ID的消息内容被替换后不会重新计算token数
+
+python -m langgraph_agent.incremental_trim --sizes 1000,2000,5000,10000
+"""
+import bisect
+import threading
+from collections import OrderedDict
+from typing import Callable, Sequence
+
+from langchain_core.messages import BaseMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+MessageTypes = str | type[BaseMessage] | Sequence[str | type[BaseMessage]]
+
+
+def is_message_type(message: BaseMessage, types: MessageTypes) -> bool:
+    """与trim_messages的start_on/end_on相同的判断：字符串按message.type比较，类按isinstance判断"""
+    if isinstance(types, (str, type)):
+        types = [types]
+    return any(message.type == t if isinstance(t, str) else isinstance(message, t) for t in types)
+
+
+class _Conversation:
+    """一个会话的token前缀和：prefix[i]是前i条消息的token数"""
+
+    def __init__(self):
+        self.prefix = [0]
+        self.last_id: str | None = None
+        self.tokens: dict[str, int] = {}
+
+
+class IncrementalTrimmer:
+    """增量计算token数的trim_messages(strategy="last")"""
+
+    def __init__(self, max_tokens: int, start_on: MessageTypes | None = "human", end_on: MessageTypes | None = None,
+                 token_counter: Callable[[list[BaseMessage]], int] = count_tokens_approximately,
+                 max_conversations: int = 1000):
+        """
+        :param max_tokens: 保留的最大token数
+        :param start_on: 裁剪后的第一条消息必须是该类型
+        :param end_on: 裁剪后的最后一条消息必须是该类型
+        :param token_counter: 计算消息列表token数的函数，必须满足按消息累加
+        :param max_conversations: 最多保存前缀和的会话数，超过后淘汰最久没有使用的会话
+        """
+        self.max_tokens = max_tokens
+        self.start_on = start_on
+        self.end_on = end_on
+        self.token_counter = token_counter
+        self.max_conversations = max_conversations
+        self._lock = threading.Lock()
+        # 会话的第一条消息ID -> 前缀和，pre_model_hook拿不到thread_id，用第一条消息区分会话
+        self._conversations: OrderedDict[str, _Conversation] = OrderedDict()
+        self.counted = 0
+        self.rebuilds = 0
+
+    def _count(self, conversation: _Conversation, message: BaseMessage) -> int:
+        if message.id is not None and message.id in conversation.tokens:
+            return conversation.tokens[message.id]
+        tokens = self.token_counter([message])
+        self.counted += 1
+        if message.id is not None:
+            conversation.tokens[message.id] = tokens
+        return tokens
+
+    def _conversation(self, messages: Sequence[BaseMessage]) -> _Conversation:
+        """取出会话的前缀和，并补上新增的消息"""
+        key = messages[0].id
+        conversation = self._conversations.get(key) if key is not None else None
+        if conversation is None:
+            conversation = _Conversation()
+            if key is not None:
+                self._conversations[key] = conversation
+                while len(self._conversations) > self.max_conversations:
+                    self._conversations.popitem(last=False)
+        else:
+            self._conversations.move_to_end(key)
+
+        known = len(conversation.prefix) - 1
+        if known > len(messages) or (known and messages[known - 1].id != conversation.last_id):
+            # 历史中间的消息被删除或替换了：按缓存的token数重建前缀和，只重新计算没见过的消息
+            self.rebuilds += 1
+            conversation.prefix = [0]
+            known = 0
+        prefix = conversation.prefix
+        for message in messages[known:]:
+            prefix.append(prefix[-1] + self._count(conversation, message))
+        conversation.last_id = messages[-1].id
+        if len(conversation.tokens) > 2 * len(messages):
+            # 删除了很多消息时清理不再使用的缓存
+            ids = {message.id for message in messages}
+            conversation.tokens = {k: v for k, v in conversation.tokens.items() if k in ids}
+        return conversation
+
+    def trim(self, messages: Sequence[BaseMessage]) -> list[BaseMessage]:
+        """
+        与trim_messages(messages, strategy="last", max_tokens, start_on, end_on, token_counter)的结果相同
+        :param messages: 完整的历史消息
+        :return: 裁剪后的消息
+        """
+        if not messages:
+            return []
+        # 去掉末尾不是end_on类型的消息
+        end = len(messages)
+        if self.end_on:
+            while end > 0 and not is_message_type(messages[end - 1], self.end_on):
+                end -= 1
+        with self._lock:
+            prefix = self._conversation(messages).prefix
+            # 二分查找token数不超过max_tokens的最长后缀：prefix[end] - prefix[start] <= max_tokens
+            start = bisect.bisect_left(prefix, prefix[end] - self.max_tokens, 0, end)
+        # 跳过开头不是start_on类型的消息
+        if self.start_on:
+            while start < end and not is_message_type(messages[start], self.start_on):
+                start += 1
+        return list(messages[start:end])
+
+    def __call__(self, state: dict) -> dict:
+        """直接作为create_react_agent的pre_model_hook使用"""
+        return {"llm_input_messages": self.trim(state["messages"])}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"conversations": len(self._conversations), "counted": self.counted, "rebuilds": self.rebuilds}
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import time
+    import uuid
+
+    from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, trim_messages
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,2000,5000,10000", help="历史消息数")
+    parser.add_argument("--max-tokens", type=int, default=384)
+    parser.add_argument("--turns", type=int, default=20, help="每个长度上连续执行的轮数")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    def make_turn() -> list[BaseMessage]:
+        """一轮对话：用户提问 -> 模型调用工具 -> 工具结果 -> 模型回答"""
+        call_id = uuid.uuid4().hex
+        return [
+            HumanMessage(content="x" * rng.randint(5, 200), id=str(uuid.uuid4())),
+            AIMessage(content="", id=str(uuid.uuid4()),
+                      tool_calls=[{"name": "add", "args": {"a": 1, "b": 2}, "id": call_id}]),
+            ToolMessage(content=str(rng.randint(0, 10 ** 6)), tool_call_id=call_id, id=str(uuid.uuid4())),
+            AIMessage(content="y" * rng.randint(5, 400), id=str(uuid.uuid4())),
+        ]
+
+    def baseline(messages, max_tokens, end_on):
+        return trim_messages(messages, strategy="last", token_counter=count_tokens_approximately,
+                             max_tokens=max_tokens, start_on="human", end_on=end_on)
+
+    # 先校验结果一致：随机的历史长度、token上限和end_on，每次调用前按add_messages的方式追加或删除消息
+    history = []
+    trimmers = {end_on: IncrementalTrimmer(0, end_on=end_on) for end_on in (None, "human", ("human", "tool"))}
+    for step in range(500):
+        action = rng.random()
+        if action < 0.8 or len(history) < 8:
+            history.extend(make_turn()[:rng.randint(1, 4)])
+        elif action < 0.9:
+            del history[rng.randrange(len(history))]
+        else:
+            start = rng.randrange(len(history))
+            del history[start:start + rng.randint(1, 6)]
+        max_tokens = rng.choice([0, 5, 50, 100, 384, 2000, 100000])
+        for end_on, trimmer in trimmers.items():
+            trimmer.max_tokens = max_tokens
+            expected = baseline(history, max_tokens, end_on)
+            actual = trimmer.trim(history)
+            assert [m.id for m in actual] == [m.id for m in expected], (step, end_on, max_tokens)
+    print(f"结果一致：500次随机校验通过，{trimmers[('human', 'tool')].stats()}")
+
+    print(f"{'messages':>10}{'trim_messages(ms)':>20}{'incremental(ms)':>18}{'speedup':>10}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        history = []
+        while len(history) < size:
+            history.extend(make_turn())
+        trimmer = IncrementalTrimmer(args.max_tokens, end_on=("human", "tool"))
+        trimmer.trim(history)
+        # 模拟之后的每一轮：追加新消息后调用一次pre_model_hook
+        turns = [make_turn() for _ in range(args.turns)]
+        base_seconds = incremental_seconds = 0.0
+        base_history, incremental_history = list(history), list(history)
+        for turn in turns:
+            base_history.extend(turn)
+            start = time.perf_counter()
+            expected = baseline(base_history, args.max_tokens, ("human", "tool"))
+            base_seconds += time.perf_counter() - start
+
+            incremental_history.extend(turn)
+            start = time.perf_counter()
+            actual = trimmer.trim(incremental_history)
+            incremental_seconds += time.perf_counter() - start
+            assert [m.id for m in actual] == [m.id for m in expected]
+        base_ms = base_seconds / args.turns * 1000
+        incremental_ms = incremental_seconds / args.turns * 1000
+        print(f"{size:>10}{base_ms:>20.3f}{incremental_ms:>18.3f}{base_ms / incremental_ms:>9.0f}x")
@@ -4,9 +4,10 @@ import threading
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
 from langchain_core.tools import tool
-from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.prebuilt import ToolNode, create_react_agent
 
+from langgraph_checkpoint.bounded_saver import BoundedInMemorySaver
+
 load_dotenv()
 @tool()
 def add(a: int, b: int)-> int:
@@ -25,7 +26,7 @@ tool_node = ToolNode(
 )
 
 # 构建一个记忆存储组件
-checkpointer = InMemorySaver()
+checkpointer = BoundedInMemorySaver(max_threads=1000, ttl=3600, keep_last=5)
 
 # 必须创建一个配置对象，主要是为了多个会话不会互相干扰，并且在需要的时候恢复之前的对话状态。
 config = {
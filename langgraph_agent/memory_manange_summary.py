@@ -5,11 +5,12 @@ from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
 from langchain_core.messages.utils import count_tokens_approximately
 from langchain_core.tools import tool
-from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.prebuilt import ToolNode, create_react_agent
 from langgraph.prebuilt.chat_agent_executor import AgentState
 from langmem.short_term import SummarizationNode, RunningSummary
 
+from langgraph_checkpoint.bounded_saver import BoundedInMemorySaver
+
 load_dotenv()
 @tool()
 def add(a: int, b: int)-> int:
@@ -28,7 +29,7 @@ tool_node = ToolNode(
 )
 
 # 构建一个记忆存储组件
-checkpointer = InMemorySaver()
+checkpointer = BoundedInMemorySaver(max_threads=1000, ttl=3600, keep_last=5)
 
 # 需要 pip install langmem
 ### 总结对话，而不传入所有内容
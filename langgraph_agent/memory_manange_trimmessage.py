@@ -3,13 +3,14 @@ import threading
 
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
-from langchain_core.messages.utils import count_tokens_approximately, trim_messages
 from langchain_core.tools import tool
-from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.prebuilt import ToolNode, create_react_agent
 from langgraph.prebuilt.chat_agent_executor import AgentState
 from langmem.short_term import SummarizationNode, RunningSummary
 
+from langgraph_agent.incremental_trim import IncrementalTrimmer
+from langgraph_checkpoint.bounded_saver import BoundedInMemorySaver
+
 load_dotenv()
 @tool()
 def add(a: int, b: int)-> int:
@@ -28,7 +29,7 @@ tool_node = ToolNode(
 )
 
 # 构建一个记忆存储组件
-checkpointer = InMemorySaver()
+checkpointer = BoundedInMemorySaver(max_threads=1000, ttl=3600, keep_last=5)
 
 # 必须创建一个配置对象，主要是为了多个会话不会互相干扰，并且在需要的时候恢复之前的对话状态。
 config = {
@@ -37,16 +38,8 @@ config = {
     }
 }
 
-def pre_model_hook(state):
-    trimmed_messages = trim_messages(
-        state["messages"],
-        strategy="last",
-        token_counter=count_tokens_approximately,
-        max_tokens=100,
-        start_on="human",
-        end_on=("human", "tool"),
-    )
-    return {"llm_input_messages": trimmed_messages}
+# 与trim_messages(strategy="last", token_counter=count_tokens_approximately)结果相同，但每轮只计算新增消息的token数
+pre_model_hook = IncrementalTrimmer(max_tokens=100, start_on="human", end_on=("human", "tool"))
 
 agent = create_react_agent(
     model=model,
@@ -5,18 +5,19 @@ from typing import Annotated
 
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
-from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
 from pydantic import BaseModel
 
+from langgraph_checkpoint.bounded_saver import BoundedInMemorySaver
+
 
 class State(BaseModel):
     messages: Annotated[list, operator.add]
 
 load_dotenv()
 llm = init_chat_model(model="gpt-4", api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL"),)
-checkpointer = InMemorySaver()
+checkpointer = BoundedInMemorySaver(max_threads=1000, ttl=3600, keep_last=5)
 
 """
 最终返回的状态就是输出
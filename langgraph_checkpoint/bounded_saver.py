@@ -0,0 +1,204 @@
+"""
+有界的内存checkpointer，可以直接替换InMemorySaver：
+InMemorySaver会永久保存每个线程的每个checkpoint，长时间运行的服务内存会一直增长。
+BoundedInMemorySaver按线程淘汰：
+1. max_threads：最多保存的线程数，超过后淘汰最久没有访问的线程（LRU）
+2. ttl：线程超过ttl秒没有访问就淘汰
+3. max_bytes：所有线程序列化数据的总字节数上限，超过后按LRU淘汰线程
+4. keep_last：每个线程只保留最近N个checkpoint（会失去更早的time travel历史）
+stats()返回命中、淘汰和占用大小的统计
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterator, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.memory import InMemorySaver
+
+
+class BoundedInMemorySaver(InMemorySaver):
+    """按线程LRU/TTL/总字节数淘汰，并且可以只保留每个线程最近N个checkpoint的InMemorySaver"""
+
+    def __init__(self, *, max_threads: int | None = None, ttl: float | None = None, max_bytes: int | None = None,
+                 keep_last: int | None = None, **kwargs: Any):
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.keep_last = keep_last
+        self._lock = threading.RLock()
+        # 线程ID -> 最近访问时间，按访问顺序排列，队首是最久没有访问的线程
+        self._last_access: OrderedDict[Any, float] = OrderedDict()
+        # 线程ID -> 序列化数据的字节数
+        self._thread_bytes: dict[Any, int] = {}
+        # (线程ID, namespace, checkpoint ID) -> 该checkpoint引用的channel版本，用于清理不再被引用的blob
+        self._channel_versions: dict[tuple, dict[str, Any]] = {}
+        # 线程ID -> 该线程的blob和writes的key，淘汰时不用遍历所有线程的数据
+        self._thread_keys: dict[Any, dict[str, set]] = {}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {"lru": 0, "ttl": 0, "bytes": 0}
+        self.pruned_checkpoints = 0
+
+    # ------------------------------
+    # 访问记录和字节统计
+    # ------------------------------
+    def _touch(self, thread_id: Any):
+        self._last_access[thread_id] = time.monotonic()
+        self._last_access.move_to_end(thread_id)
+
+    def _add_bytes(self, thread_id: Any, size: int):
+        self._thread_bytes[thread_id] = self._thread_bytes.get(thread_id, 0) + size
+        self.total_bytes += size
+
+    def _keys(self, thread_id: Any) -> dict[str, set]:
+        return self._thread_keys.setdefault(thread_id, {"blobs": set(), "writes": set()})
+
+    def _writes_bytes(self, key: tuple) -> int:
+        return sum(len(value[1]) for _, _, value, _ in self.writes.get(key, {}).values())
+
+    def _expired(self, thread_id: Any, now: float) -> bool:
+        return self.ttl is not None and now - self._last_access.get(thread_id, now) > self.ttl
+
+    # ------------------------------
+    # 淘汰
+    # ------------------------------
+    def _drop_thread(self, thread_id: Any):
+        """删除线程的所有数据，并扣减字节统计"""
+        for checkpoint_ns, checkpoints in self.storage.pop(thread_id, {}).items():
+            for checkpoint_id in checkpoints:
+                self._channel_versions.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+        keys = self._thread_keys.pop(thread_id, {"blobs": (), "writes": ()})
+        for key in keys["writes"]:
+            self.writes.pop(key, None)
+        for key in keys["blobs"]:
+            self.blobs.pop(key, None)
+        self._last_access.pop(thread_id, None)
+        self.total_bytes -= self._thread_bytes.pop(thread_id, 0)
+
+    def _prune_thread(self, thread_id: Any, checkpoint_ns: str):
+        """只保留线程最近keep_last个checkpoint，删除更早的checkpoint、writes和不再被引用的blob"""
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if self.keep_last is None or len(checkpoints) <= self.keep_last:
+            return
+        checkpoint_ids = sorted(checkpoints)
+        keys = self._keys(thread_id)
+        removed = 0
+        for checkpoint_id in checkpoint_ids[:-self.keep_last]:
+            checkpoint, metadata, _ = checkpoints.pop(checkpoint_id)
+            removed += len(checkpoint[1]) + len(metadata[1])
+            removed += self._writes_bytes((thread_id, checkpoint_ns, checkpoint_id))
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            keys["writes"].discard((thread_id, checkpoint_ns, checkpoint_id))
+            self._channel_versions.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self.pruned_checkpoints += 1
+        referenced = set()
+        for checkpoint_id in checkpoint_ids[-self.keep_last:]:
+            versions = self._channel_versions.get((thread_id, checkpoint_ns, checkpoint_id), {})
+            referenced.update((thread_id, checkpoint_ns, channel, version) for channel, version in versions.items())
+        for key in [key for key in keys["blobs"] if key[1] == checkpoint_ns and key not in referenced]:
+            keys["blobs"].discard(key)
+            removed += len(self.blobs.pop(key)[1])
+        self._add_bytes(thread_id, -removed)
+
+    def _evict(self, current: Any = None):
+        """
+        按ttl、max_threads、max_bytes依次淘汰线程，当前正在写入的线程不会被淘汰
+        :param current: 当前线程ID
+        :return:
+        """
+        now = time.monotonic()
+        while self._last_access:
+            oldest = next(iter(self._last_access))
+            if oldest == current:
+                break
+            if self._expired(oldest, now):
+                reason = "ttl"
+            elif self.max_threads is not None and len(self._last_access) > self.max_threads:
+                reason = "lru"
+            elif self.max_bytes is not None and self.total_bytes > self.max_bytes:
+                reason = "bytes"
+            else:
+                break
+            self._drop_thread(oldest)
+            self.evictions[reason] += 1
+
+    # ------------------------------
+    # 覆盖InMemorySaver的读写方法
+    # ------------------------------
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            if thread_id in self._last_access and self._expired(thread_id, time.monotonic()):
+                self._drop_thread(thread_id)
+                self.evictions["ttl"] += 1
+            # InMemorySaver的storage是defaultdict，直接访问不存在的线程会创建空记录
+            result = super().get_tuple(config) if thread_id in self.storage else None
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._touch(thread_id)
+            return result
+
+    def list(self, config: RunnableConfig | None, *, filter: dict[str, Any] | None = None,
+             before: RunnableConfig | None = None, limit: int | None = None) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            if config and config["configurable"]["thread_id"] not in self.storage:
+                return iter(())
+            # 先取出结果再释放锁，避免迭代过程中被其他线程淘汰
+            return iter(list(super().list(config, filter=filter, before=before, limit=limit)))
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            result = super().put(config, checkpoint, metadata, new_versions)
+            saved, saved_metadata, _ = self.storage[thread_id][checkpoint_ns][checkpoint["id"]]
+            size = len(saved[1]) + len(saved_metadata[1])
+            blob_keys = self._keys(thread_id)["blobs"]
+            for channel, version in new_versions.items():
+                blob_key = (thread_id, checkpoint_ns, channel, version)
+                if blob_key not in blob_keys:
+                    blob_keys.add(blob_key)
+                    size += len(self.blobs[blob_key][1])
+            self._add_bytes(thread_id, size)
+            self._channel_versions[(thread_id, checkpoint_ns, checkpoint["id"])] = dict(checkpoint["channel_versions"])
+            self._touch(thread_id)
+            self._prune_thread(thread_id, checkpoint_ns)
+            self._evict(current=thread_id)
+            return result
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        key = (thread_id, config["configurable"].get("checkpoint_ns", ""), config["configurable"]["checkpoint_id"])
+        with self._lock:
+            before = self._writes_bytes(key)
+            super().put_writes(config, writes, task_id, task_path)
+            self._keys(thread_id)["writes"].add(key)
+            self._add_bytes(thread_id, self._writes_bytes(key) - before)
+            self._touch(thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._drop_thread(thread_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "threads": len(self._last_access),
+                "checkpoints": sum(len(checkpoints) for namespaces in self.storage.values()
+                                   for checkpoints in namespaces.values()),
+                "bytes": self.total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": dict(self.evictions),
+                "pruned_checkpoints": self.pruned_checkpoints,
+            }
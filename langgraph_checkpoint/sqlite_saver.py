@@ -0,0 +1,336 @@
+"""
+基于SQLite的持久化checkpointer：
+1. checkpoint保存在本地SQLite文件中，挂起等待人工审查的图几乎不占内存，进程重启后可以用Command(resume=...)继续执行
+2. 使用WAL模式，读写互不阻塞
+3. 批量提交：写入先在同一个事务中累积，达到batch_size条或超过flush_interval秒后统一提交，
+   同一个连接上的读取可以看到还没有提交的写入
+4. checkpoints和writes表都按thread_id建立索引
+"""
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    INTERRUPT,
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE INDEX IF NOT EXISTS idx_checkpoints_thread_id ON checkpoints (thread_id);
+CREATE INDEX IF NOT EXISTS idx_writes_thread_id ON writes (thread_id);
+"""
+
+
+class SqliteSaver(BaseCheckpointSaver[int]):
+    """把checkpoint保存到本地SQLite文件的checkpointer"""
+
+    def __init__(self, path: str = "checkpoints.db", *, batch_size: int = 64, flush_interval: float = 0.05,
+                 **kwargs: Any):
+        """
+        :param path: 数据库文件路径，":memory:"表示内存数据库
+        :param batch_size: 累积多少条写入后提交一次事务
+        :param flush_interval: 第一条未提交的写入最多等待多少秒后提交
+        """
+        super().__init__(**kwargs)
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.RLock()
+        # 所有线程共用一个连接，由_lock保证串行访问，这样读取可以看到同一事务里还没有提交的写入
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        # 当前事务中的写入条数；事务是否开启以conn.in_transaction为准（空的写入也可能开启了事务）
+        self._pending = 0
+        self._first_pending: float | None = None
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="sqlite-saver-flush", daemon=True)
+        self._flusher.start()
+
+    # ------------------------------
+    # 批量提交
+    # ------------------------------
+    @contextmanager
+    def _write(self, count: int = 1):
+        """
+        一次写入：加入当前的批量事务（没有时开启），写入条数或等待时间达到上限时提交。
+        每次写入包在savepoint中，出错时只回滚这次写入，不影响同一事务中之前的写入，连接也不会停留在出错的事务中
+        :param count: 写入的条数
+        """
+        with self._lock:
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN")
+                self._first_pending = time.monotonic()
+            self.conn.execute("SAVEPOINT write")
+            try:
+                yield
+            except BaseException:
+                if self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK TO write")
+                    self.conn.execute("RELEASE write")
+                if not self.conn.in_transaction:
+                    # SQLite在部分错误（例如磁盘已满）时会自动回滚整个事务
+                    self._pending = 0
+                    self._first_pending = None
+                raise
+            self.conn.execute("RELEASE write")
+            self._pending += count
+            if self._pending >= self.batch_size or time.monotonic() - self._first_pending >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        """提交所有未提交的写入"""
+        with self._lock:
+            if self.conn.in_transaction:
+                self.conn.execute("COMMIT")
+            self._pending = 0
+            self._first_pending = None
+
+    def _flush_loop(self):
+        # 没有新的写入时，由后台线程保证未提交的写入最多等待flush_interval秒
+        while not self._closed.wait(self.flush_interval):
+            with self._lock:
+                if self._first_pending is not None and time.monotonic() - self._first_pending >= self.flush_interval:
+                    self.flush()
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            self.flush()
+            self.conn.close()
+
+    def __enter__(self) -> "SqliteSaver":
+        return self
+
+    def __exit__(self, *exc_info: Any):
+        self.close()
+
+    # ------------------------------
+    # 读取
+    # ------------------------------
+    def _load_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> list[tuple[str, str, Any]]:
+        rows = self.conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return [(task_id, channel, self.serde.loads_typed((type_, value))) for task_id, channel, type_, value in rows]
+
+    def _to_tuple(self, row: tuple) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        return CheckpointTuple(
+            config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                     "checkpoint_id": checkpoint_id}},
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config={"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                            "checkpoint_id": parent_checkpoint_id}} if parent_checkpoint_id else None,
+            pending_writes=self._load_writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        sql = "SELECT * FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?"
+        params: list[Any] = [thread_id, checkpoint_ns]
+        if checkpoint_id := get_checkpoint_id(config):
+            sql += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        else:
+            sql += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self._lock:
+            row = self.conn.execute(sql, params).fetchone()
+            return self._to_tuple(row) if row else None
+
+    def list(self, config: RunnableConfig | None, *, filter: dict[str, Any] | None = None,
+             before: RunnableConfig | None = None, limit: int | None = None) -> Iterator[CheckpointTuple]:
+        sql = "SELECT * FROM checkpoints WHERE 1 = 1"
+        params: list[Any] = []
+        if config:
+            sql += " AND thread_id = ?"
+            params.append(str(config["configurable"]["thread_id"]))
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                sql += " AND checkpoint_ns = ?"
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                sql += " AND checkpoint_id = ?"
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            sql += " AND checkpoint_id < ?"
+            params.append(before_id)
+        sql += " ORDER BY checkpoint_id DESC"
+        with self._lock:
+            rows = self.conn.execute(sql, params).fetchall()
+            result = []
+            for row in rows:
+                item = self._to_tuple(row)
+                # metadata是序列化保存的，过滤条件只能在反序列化之后判断
+                if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                result.append(item)
+                if limit is not None and len(result) >= limit:
+                    break
+        return iter(result)
+
+    def list_threads(self) -> "list[str]":
+        """所有保存过checkpoint的线程ID"""
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT DISTINCT thread_id FROM checkpoints")]
+
+    def _interrupts_sql(self, node: str | None) -> "tuple[str, list[Any]]":
+        # 每个线程最新的checkpoint上还挂着中断写入，说明该线程正挂起等待恢复
+        sql = (
+            "FROM writes w JOIN ("
+            "  SELECT thread_id, checkpoint_ns, MAX(checkpoint_id) AS checkpoint_id FROM checkpoints"
+            "  WHERE checkpoint_ns = '' GROUP BY thread_id"
+            ") c ON w.thread_id = c.thread_id AND w.checkpoint_ns = c.checkpoint_ns AND w.checkpoint_id = c.checkpoint_id "
+            "WHERE w.channel = ?"
+        )
+        params = [INTERRUPT]
+        if node:
+            # task_path形如"~__pregel_pull, human_review_tool"
+            sql += " AND (w.task_path = ? OR w.task_path LIKE ?)"
+            params += [node, f"%, {node}"]
+        return sql, params
+
+    def list_interrupts(self, node: str | None = None, limit: int = 50, offset: int = 0) -> "list[dict]":
+        """
+        分页列出挂起中的线程及其中断信息
+        :param node: 只列出挂起在该节点的线程
+        :param limit:
+        :param offset:
+        :return: [{"thread_id", "checkpoint_id", "interrupts"}]
+        """
+        sql, params = self._interrupts_sql(node)
+        with self._lock:
+            # 先按线程分页（与count_interrupts一致），一个线程可能有多条中断写入
+            thread_ids = [row[0] for row in self.conn.execute(
+                f"SELECT DISTINCT w.thread_id {sql} ORDER BY w.thread_id LIMIT ? OFFSET ?", params + [limit, offset]
+            )]
+            if not thread_ids:
+                return []
+            rows = self.conn.execute(
+                f"SELECT w.thread_id, w.checkpoint_id, w.type, w.value {sql} "
+                f"AND w.thread_id IN ({', '.join('?' * len(thread_ids))}) ORDER BY w.thread_id, w.task_id, w.idx",
+                params + thread_ids,
+            ).fetchall()
+        items: dict[str, dict] = {}
+        for thread_id, checkpoint_id, type_, value in rows:
+            item = items.setdefault(thread_id, {"thread_id": thread_id, "checkpoint_id": checkpoint_id,
+                                                "interrupts": []})
+            item["interrupts"].extend(self.serde.loads_typed((type_, value)))
+        return [items[thread_id] for thread_id in thread_ids if thread_id in items]
+
+    def count_interrupts(self, node: str | None = None) -> int:
+        """挂起中的线程数"""
+        sql, params = self._interrupts_sql(node)
+        with self._lock:
+            return self.conn.execute(f"SELECT COUNT(DISTINCT w.thread_id) {sql}", params).fetchone()[0]
+
+    # ------------------------------
+    # 写入
+    # ------------------------------
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, serialized = self.serde.dumps_typed(checkpoint)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._write():
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 type_, serialized, metadata_type, serialized_metadata),
+            )
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        if not writes:
+            return
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        regular, special = [], []
+        for idx, (channel, value) in enumerate(writes):
+            type_, serialized = self.serde.dumps_typed(value)
+            row = (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                   channel, type_, serialized, task_path)
+            (special if channel in WRITES_IDX_MAP else regular).append(row)
+        # 和InMemorySaver一致：普通写入已存在时忽略，特殊channel（错误、中断、恢复等）覆盖
+        with self._lock:
+            with self._write(len(regular) + len(special)):
+                self.conn.executemany("INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", regular)
+                self.conn.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", special)
+            if special:
+                # 中断、错误等写入意味着图即将挂起或失败，立即提交，保证进程重启后可以恢复
+                self.flush()
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            with self._write():
+                self.conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (str(thread_id),))
+                self.conn.execute("DELETE FROM writes WHERE thread_id = ?", (str(thread_id),))
+            self.flush()
+
+    # ------------------------------
+    # 异步接口：SQLite的读写都在毫秒以内，和InMemorySaver一样直接调用同步方法
+    # ------------------------------
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return self.get_tuple(config)
+
+    async def alist(self, config: RunnableConfig | None, *, filter: dict[str, Any] | None = None,
+                    before: RunnableConfig | None = None, limit: int | None = None):
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        return self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return self.delete_thread(thread_id)
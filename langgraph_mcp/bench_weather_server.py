@@ -0,0 +1,162 @@
+"""
+weather_server.py的压测：
+1. 启动本地fake NWS服务（fake_nws_server.py），weather_server通过NWS_BASE_URL访问它，不访问外网
+2. 在子进程中以streamable-http方式启动weather_server
+3. 按逐级增加的并发数调用get_forecast/get_alerts，统计吞吐和p50/p95/p99延迟
+
+python -m langgraph_mcp.bench_weather_server --levels 1,8,32,128 --calls 500 --nws-latency 0.05
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+from langgraph_mcp.fake_nws_server import FakeNWS, start_fake_nws_server
+from multi_agent.stream_metrics import percentile
+
+# 美国主要城市的坐标，以及预警查询使用的州
+default_locations = [
+    (40.7128, -74.0060), (34.0522, -118.2437), (41.8781, -87.6298), (29.7604, -95.3698), (33.4484, -112.0740),
+    (39.9526, -75.1652), (29.4241, -98.4936), (32.7157, -117.1611), (32.7767, -96.7970), (37.3382, -121.8863),
+    (47.6062, -122.3321), (38.9072, -77.0369), (42.3601, -71.0589), (39.7392, -104.9903), (25.7617, -80.1918),
+]
+default_states = ["CA", "TX", "NY", "FL", "WA", "IL", "CO", "MA", "AZ", "PA"]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_weather_server(nws_base_url: str, port: int, rate_limit: float, verbose: bool = False) -> subprocess.Popen:
+    """在子进程中启动weather_server，等待端口可以连接"""
+    env = {
+        **os.environ,
+        "NWS_BASE_URL": nws_base_url,
+        "WEATHER_MCP_HOST": "127.0.0.1",
+        "WEATHER_MCP_PORT": str(port),
+        "NWS_RATE_LIMIT": str(rate_limit),
+        "NWS_RATE_BURST": str(max(1, int(rate_limit))),
+    }
+    output = None if verbose else subprocess.DEVNULL
+    process = subprocess.Popen([sys.executable, "-m", "langgraph_mcp.weather_server"], env=env,
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               stdout=output, stderr=output)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"weather_server启动失败，退出码：{process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise TimeoutError("weather_server启动超时")
+
+
+async def run_level(client: MultiServerMCPClient, concurrency: int, calls: int, alerts_ratio: float,
+                    rng: random.Random) -> dict:
+    """
+    在一个MCP会话上以给定的并发数执行calls次工具调用
+    :return: {"concurrency", "calls", "errors", "elapsed", "throughput", "p50_ms", "p95_ms", "p99_ms"}
+    """
+    requests = []
+    for _ in range(calls):
+        if rng.random() < alerts_ratio:
+            requests.append(("get_alerts", {"state": rng.choice(default_states)}))
+        else:
+            latitude, longitude = rng.choice(default_locations)
+            requests.append(("get_forecast", {"latitude": latitude, "longitude": longitude}))
+
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+    async with client.session("weather") as session:
+
+        async def _call(name: str, arguments: dict):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    result = await session.call_tool(name, arguments)
+                    # 上游重试后仍然失败时工具返回"Unable to fetch ..."，结构化结果中包含error字段
+                    structured = (result.structuredContent or {}).get("result")
+                    if result.isError or (isinstance(structured, dict) and "error" in structured) or any(
+                            getattr(content, "text", "").startswith("Unable to") for content in result.content):
+                        errors += 1
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(_call(name, arguments) for name, arguments in requests))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "calls": calls,
+        "errors": errors,
+        "elapsed": elapsed,
+        "throughput": calls / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def run_levels(url: str, levels: list[int], calls: int, alerts_ratio: float, seed: int, fake: FakeNWS):
+    client = MultiServerMCPClient({"weather": {"url": url, "transport": "streamable_http"}})
+    rng = random.Random(seed)
+    print(f"{'concurrency':>12}{'calls':>8}{'errors':>8}{'calls/s':>10}{'p50(ms)':>10}{'p95(ms)':>10}"
+          f"{'p99(ms)':>10}{'upstream':>10}")
+    for concurrency in levels:
+        upstream_before = sum(count for kind, count in fake.requests.items() if kind in ("points", "forecast", "alerts"))
+        result = await run_level(client, concurrency, calls, alerts_ratio, rng)
+        upstream = sum(count for kind, count in fake.requests.items()
+                       if kind in ("points", "forecast", "alerts")) - upstream_before
+        print(f"{result['concurrency']:>12}{result['calls']:>8}{result['errors']:>8}{result['throughput']:>10.1f}"
+              f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}{upstream:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", default="1,8,32,128", help="逐级增加的并发数")
+    parser.add_argument("--calls", type=int, default=500, help="每个并发级别的工具调用次数")
+    parser.add_argument("--alerts-ratio", type=float, default=0.3, help="get_alerts调用的比例")
+    parser.add_argument("--nws-latency", type=float, default=0.05, help="fake NWS的平均延迟（秒）")
+    parser.add_argument("--nws-jitter", type=float, default=0.01)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fake NWS返回错误的比例")
+    parser.add_argument("--error-status", type=int, default=503, choices=[429, 503])
+    parser.add_argument("--cache-max-age", type=int, default=0, help="fake NWS响应的max-age，0表示每次都要条件请求")
+    parser.add_argument("--rate-limit", type=float, default=1000.0, help="weather_server访问NWS的限流（每秒请求数）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--verbose", action="store_true", help="输出weather_server的日志")
+    args = parser.parse_args()
+
+    fake = FakeNWS(latency=args.nws_latency, jitter=args.nws_jitter, error_rate=args.error_rate,
+                   error_status=args.error_status, cache_max_age=args.cache_max_age, seed=args.seed)
+    nws_url, nws_server = start_fake_nws_server(fake)
+    port = _free_port()
+    process = start_weather_server(nws_url, port, args.rate_limit, args.verbose)
+    try:
+        print(f"fake NWS：{nws_url}，延迟 {args.nws_latency}s±{args.nws_jitter}s，错误率 {args.error_rate}")
+        asyncio.run(run_levels(f"http://127.0.0.1:{port}/mcp", [int(level) for level in args.levels.split(",")],
+                               args.calls, args.alerts_ratio, args.seed, fake))
+        print(f"fake NWS请求统计：{dict(fake.requests)}")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+        nws_server.should_exit = True
+
+
+if __name__ == '__main__':
+    main()
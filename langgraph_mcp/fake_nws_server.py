@@ -0,0 +1,131 @@
+"""
+本地的NWS（api.weather.gov）替身，用于在不访问外网的情况下测试和压测weather_server.py：
+1. 用fixtures/nws下录制的响应返回/points、/gridpoints/.../forecast和/alerts/active/area
+2. 可配置延迟（均值+抖动）和错误注入（按比例返回503/429）
+3. 响应带ETag和Cache-Control，支持If-None-Match条件请求
+
+单独运行：python -m langgraph_mcp.fake_nws_server --port 8001 --latency 0.05
+再用NWS_BASE_URL=http://127.0.0.1:8001启动weather_server
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import Counter
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "nws")
+
+
+def _load_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, f"{name}.json"), encoding="utf-8") as f:
+        return f.read()
+
+
+def _render(template: str, **values) -> str:
+    for name, value in values.items():
+        template = template.replace("{" + name + "}", str(value))
+    return template
+
+
+class FakeNWS:
+    """fake NWS服务的配置和请求统计"""
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, cache_max_age: int = 0, seed: int | None = None):
+        """
+        :param latency: 平均响应延迟（秒）
+        :param jitter: 延迟的标准差（秒）
+        :param error_rate: 返回错误的比例
+        :param error_status: 注入的错误状态码（503或429）
+        :param cache_max_age: 响应的Cache-Control: max-age
+        :param seed:
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.cache_max_age = cache_max_age
+        self.base_url = ""
+        self.requests = Counter()
+        self._rng = random.Random(seed)
+        self._fixtures = {name: _load_fixture(name) for name in ("points", "forecast", "alerts")}
+
+    async def _respond(self, request: Request, kind: str, body: str) -> Response:
+        self.requests[kind] += 1
+        delay = max(0.0, self._rng.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+        if delay:
+            await asyncio.sleep(delay)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self.requests[f"error_{self.error_status}"] += 1
+            headers = {"Retry-After": "0"} if self.error_status == 429 else {}
+            return Response(status_code=self.error_status, headers=headers)
+        etag = f'"{hashlib.sha1(body.encode("utf-8")).hexdigest()[:16]}"'
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={self.cache_max_age}"}
+        if request.headers.get("if-none-match") == etag:
+            self.requests["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="application/geo+json", headers=headers)
+
+    async def points(self, request: Request) -> Response:
+        latitude, longitude = request.path_params["coordinates"].split(",")
+        # 按坐标生成网格，约2.5公里一个网格
+        grid_x, grid_y = int(float(longitude) * 40) % 200, int(float(latitude) * 40) % 200
+        body = _render(self._fixtures["points"], base_url=self.base_url, latitude=latitude, longitude=longitude,
+                       office="TST", grid_x=grid_x, grid_y=grid_y)
+        return await self._respond(request, "points", body)
+
+    async def forecast(self, request: Request) -> Response:
+        return await self._respond(request, "forecast", self._fixtures["forecast"])
+
+    async def alerts(self, request: Request) -> Response:
+        body = _render(self._fixtures["alerts"], state=request.path_params["state"])
+        return await self._respond(request, "alerts", body)
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/points/{coordinates}", self.points),
+            Route("/gridpoints/{office}/{grid}/forecast", self.forecast),
+            Route("/alerts/active/area/{state}", self.alerts),
+        ])
+
+
+def start_fake_nws_server(fake: FakeNWS, host: str = "127.0.0.1", port: int = 0) -> tuple[str, uvicorn.Server]:
+    """
+    在后台线程中启动fake NWS服务
+    :param fake:
+    :param host:
+    :param port: 0表示随机端口
+    :return: (服务地址，作为NWS_BASE_URL, uvicorn服务，调用server.should_exit = True停止)
+    """
+    server = uvicorn.Server(uvicorn.Config(fake.app(), host=host, port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="fake-nws-server", daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    fake.base_url = f"http://{host}:{port}"
+    return fake.base_url, server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503, choices=[429, 503])
+    parser.add_argument("--cache-max-age", type=int, default=0)
+    args = parser.parse_args()
+    fake = FakeNWS(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                   error_status=args.error_status, cache_max_age=args.cache_max_age)
+    fake.base_url = f"http://{args.host}:{args.port}"
+    uvicorn.run(fake.app(), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,146 @@
+"""
+进程内的MCP传输：在当前进程中加载FastMCP服务模块，客户端和服务端通过内存流通信，
+省掉stdio的管道、HTTP的socket和JSON序列化，MCP的协议语义（初始化、list_tools、call_tool）不变。
+
+连接配置：{"transport": "in_process", "module": "langgraph_mcp.math_server", "server": "mcp"}
+MCPSessionPool和CachedToolLoader都通过open_session支持这种连接
+
+python -m langgraph_mcp.in_process --calls 200 对比stdio、streamable-http和进程内三种传输的单次调用耗时
+"""
+import argparse
+import asyncio
+import importlib
+import importlib.util
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+from langchain_mcp_adapters.sessions import create_session
+from mcp import ClientSession
+from mcp.server import FastMCP
+from mcp.shared.memory import create_connected_server_and_client_session
+
+from multi_agent.stream_metrics import percentile
+
+IN_PROCESS = "in_process"
+
+
+def in_process_connection(module: str, server: str = "mcp") -> dict[str, Any]:
+    """
+    :param module: FastMCP服务所在的模块，例如langgraph_mcp.math_server
+    :param server: 模块中FastMCP实例的变量名
+    :return:
+    """
+    return {"transport": IN_PROCESS, "module": module, "server": server}
+
+
+def load_server(connection: dict[str, Any]) -> FastMCP:
+    server = getattr(importlib.import_module(connection["module"]), connection.get("server", "mcp"))
+    if not isinstance(server, FastMCP):
+        raise TypeError(f"{connection['module']}.{connection.get('server', 'mcp')}不是FastMCP实例")
+    return server
+
+
+def module_file(connection: dict[str, Any]) -> str | None:
+    """服务模块的文件路径，用于计算服务指纹"""
+    spec = importlib.util.find_spec(connection["module"])
+    return spec.origin if spec is not None else None
+
+
+@asynccontextmanager
+async def open_session(connection: dict[str, Any]) -> AsyncIterator[ClientSession]:
+    """
+    建立已经完成初始化的MCP session，支持in_process和langchain_mcp_adapters支持的所有连接
+    :param connection:
+    :return:
+    """
+    if connection.get("transport") == IN_PROCESS:
+        async with create_connected_server_and_client_session(load_server(connection)) as session:
+            yield session
+    else:
+        async with create_session(connection) as session:
+            await session.initialize()
+            yield session
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_http_math_server(port: int) -> subprocess.Popen:
+    """在子进程中以streamable-http方式启动math_server"""
+    code = ("from langgraph_mcp.math_server import mcp; "
+            f"mcp.settings.host = '127.0.0.1'; mcp.settings.port = {port}; mcp.settings.log_level = 'WARNING'; "
+            "mcp.run(transport='streamable-http')")
+    process = subprocess.Popen([sys.executable, "-c", code], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise TimeoutError("math_server启动超时")
+
+
+async def _measure(connection: dict[str, Any], calls: int) -> dict:
+    """在一个持久session上顺序调用calls次，排除建立连接的耗时"""
+    async with open_session(connection) as session:
+        for i in range(10):
+            await session.call_tool("add", {"a": i, "b": 1})
+        latencies = []
+        for i in range(calls):
+            start = time.perf_counter()
+            await session.call_tool("add", {"a": i, "b": 1})
+            latencies.append(time.perf_counter() - start)
+        # 较大的请求体：序列化开销更明显
+        values = list(range(10_000))
+        batch_latencies = []
+        for _ in range(max(calls // 10, 1)):
+            start = time.perf_counter()
+            await session.call_tool("reduce", {"op": "sum", "values": values})
+            batch_latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    batch_latencies.sort()
+    return {"p50_ms": percentile(latencies, 50) * 1000, "p95_ms": percentile(latencies, 95) * 1000,
+            "batch_p50_ms": percentile(batch_latencies, 50) * 1000}
+
+
+async def _bench(calls: int):
+    port = _free_port()
+    process = _start_http_math_server(port)
+    connections = {
+        "stdio": {
+            "command": sys.executable,
+            "args": [os.path.join(os.path.dirname(os.path.abspath(__file__)), "math_server.py")],
+            "transport": "stdio",
+        },
+        "streamable_http": {"url": f"http://127.0.0.1:{port}/mcp", "transport": "streamable_http"},
+        IN_PROCESS: in_process_connection("langgraph_mcp.math_server"),
+    }
+    try:
+        print(f"{'transport':<18}{'add p50(ms)':>14}{'add p95(ms)':>14}{'reduce(10k) p50(ms)':>22}")
+        for name, connection in connections.items():
+            result = await _measure(connection, calls)
+            print(f"{name:<18}{result['p50_ms']:>14.3f}{result['p95_ms']:>14.3f}{result['batch_p50_ms']:>22.3f}")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+    # 进程内的服务和客户端共用日志，关闭每个请求的INFO日志，与其他传输（日志在子进程中）保持一致
+    logging.getLogger("mcp").setLevel(logging.WARNING)
+    asyncio.run(_bench(args.calls))
@@ -1,7 +1,17 @@
+import ast
+import math
+import operator
+
+import numpy as np
 from mcp.server import FastMCP
 
 mcp = FastMCP("math_map_server")
 
+# 输入大小限制，防止一次调用占用过多内存和CPU
+MAX_ELEMENTS = 100_000
+MAX_EXPRESSION_LENGTH = 500
+MAX_EXPRESSION_NODES = 200
+
 @mcp.tool()
 async def add(a: int, b: int)-> int:
     """
@@ -12,5 +22,226 @@ async def add(a: int, b: int)-> int:
     """
     return a + b
 
+
+# ------------------------------
+# 批量计算工具：一次调用处理整个数组，代替逐个调用add等标量工具
+# ------------------------------
+def _to_array(values, name: str = "values") -> np.ndarray:
+    """
+    转换为float64数组并检查大小
+    :param values: 数字、数字列表或二维列表
+    :param name: 参数名，用于错误信息
+    :return:
+    """
+    try:
+        array = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name}必须是数字或数字列表（二维列表的每行长度必须相同）")
+    if array.ndim > 2:
+        raise ValueError(f"{name}最多支持二维数组")
+    if array.size > MAX_ELEMENTS:
+        raise ValueError(f"{name}最多{MAX_ELEMENTS}个元素，实际{array.size}个")
+    return array
+
+
+def _to_result(array: np.ndarray) -> float | list:
+    """转换为JSON可以表示的结果，NaN和无穷大转换为None"""
+    if array.ndim == 0:
+        value = float(array)
+        return value if np.isfinite(value) else None
+    array = array.astype(object)
+    array[~np.isfinite(array.astype(np.float64))] = None
+    return array.tolist()
+
+
+ELEMENTWISE_OPS = {
+    "add": np.add,
+    "sub": np.subtract,
+    "mul": np.multiply,
+    "div": np.divide,
+    "pow": np.power,
+    "mod": np.mod,
+    "max": np.maximum,
+    "min": np.minimum,
+}
+
+REDUCE_OPS = {
+    "sum": np.sum,
+    "mean": np.mean,
+    "min": np.min,
+    "max": np.max,
+    "prod": np.prod,
+    "std": np.std,
+    "var": np.var,
+    "median": np.median,
+}
+
+
+@mcp.tool()
+async def elementwise(op: str, a: list[float] | list[list[float]], b: float | list[float] | list[list[float]]
+                      ) -> list[float | None] | list[list[float | None]]:
+    """
+    对两个数组逐元素计算，b可以是一个数字（与a的每个元素计算）
+    :param op: add | sub | mul | div | pow | mod | max | min
+    :param a: 数字列表或二维列表
+    :param b: 数字、数字列表或二维列表，形状需要与a相同或可以广播
+    :return: 结果列表，除以0等无效结果为null
+    """
+    if op not in ELEMENTWISE_OPS:
+        raise ValueError(f"不支持的运算：{op}，可选：{', '.join(ELEMENTWISE_OPS)}")
+    left, right = _to_array(a, "a"), _to_array(b, "b")
+    try:
+        shape = np.broadcast_shapes(left.shape, right.shape)
+    except ValueError:
+        raise ValueError(f"a和b的形状不匹配：{left.shape}和{right.shape}")
+    # (1, N)和(N, 1)广播后是N²个元素，结果的大小也需要限制
+    if math.prod(shape) > MAX_ELEMENTS:
+        raise ValueError(f"结果最多{MAX_ELEMENTS}个元素，广播后的形状为{shape}")
+    with np.errstate(all="ignore"):
+        return _to_result(ELEMENTWISE_OPS[op](left, right))
+
+
+@mcp.tool()
+async def reduce(op: str, values: list[float] | list[list[float]], axis: int | None = None) -> float | list | None:
+    """
+    对数组做聚合计算
+    :param op: sum | mean | min | max | prod | std | var | median
+    :param values: 数字列表或二维列表
+    :param axis: 二维列表按行（1）或按列（0）聚合，不传时对所有元素聚合
+    :return:
+    """
+    if op not in REDUCE_OPS:
+        raise ValueError(f"不支持的聚合：{op}，可选：{', '.join(REDUCE_OPS)}")
+    array = _to_array(values)
+    if array.size == 0:
+        raise ValueError("values不能为空")
+    if axis is not None and not -array.ndim <= axis < array.ndim:
+        raise ValueError(f"axis超出范围：{axis}")
+    with np.errstate(all="ignore"):
+        return _to_result(np.asarray(REDUCE_OPS[op](array, axis=axis)))
+
+
+@mcp.tool()
+async def dot(a: list[float] | list[list[float]], b: list[float] | list[list[float]]) -> float | list | None:
+    """
+    向量点积或矩阵乘法
+    :param a: 向量或矩阵
+    :param b: 向量或矩阵，a的列数需要等于b的行数
+    :return:
+    """
+    left, right = _to_array(a, "a"), _to_array(b, "b")
+    if left.ndim == 0 or right.ndim == 0:
+        raise ValueError("a和b必须是向量或矩阵")
+    if left.shape[-1] != right.shape[0]:
+        raise ValueError(f"a和b的形状不匹配：{left.shape}和{right.shape}")
+    # 结果矩阵的大小也需要限制
+    if left.ndim == 2 and right.ndim == 2 and left.shape[0] * right.shape[1] > MAX_ELEMENTS:
+        raise ValueError(f"结果最多{MAX_ELEMENTS}个元素")
+    with np.errstate(all="ignore"):
+        return _to_result(np.asarray(np.dot(left, right)))
+
+
+@mcp.tool()
+async def cumulative(values: list[float], op: str = "sum") -> list[float | None]:
+    """
+    累计和或累计乘积
+    :param values: 数字列表
+    :param op: sum | prod
+    :return:
+    """
+    if op not in ("sum", "prod"):
+        raise ValueError(f"不支持的运算：{op}，可选：sum, prod")
+    array = _to_array(values)
+    if array.ndim != 1:
+        raise ValueError("values必须是一维数字列表")
+    with np.errstate(all="ignore"):
+        return _to_result(np.cumsum(array) if op == "sum" else np.cumprod(array))
+
+
+# ------------------------------
+# 安全的表达式计算：只允许数字、变量、四则运算和白名单中的函数，不执行任意代码
+# ------------------------------
+BINARY_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+UNARY_OPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+EXPRESSION_FUNCTIONS = {
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "exp": np.exp,
+    "log": np.log,
+    "log10": np.log10,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "round": np.round,
+    "sum": np.sum,
+    "mean": np.mean,
+    "min": np.min,
+    "max": np.max,
+    "std": np.std,
+    "cumsum": np.cumsum,
+}
+EXPRESSION_CONSTANTS = {"pi": np.pi, "e": np.e}
+
+
+def _eval_node(node: ast.AST, variables: dict[str, np.ndarray]) -> np.ndarray:
+    if isinstance(node, ast.Expression):
+        return _eval_node(node.body, variables)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return np.asarray(node.value, dtype=np.float64)
+    if isinstance(node, ast.Name):
+        if node.id in variables:
+            return variables[node.id]
+        if node.id in EXPRESSION_CONSTANTS:
+            return np.asarray(EXPRESSION_CONSTANTS[node.id])
+        raise ValueError(f"未定义的变量：{node.id}")
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPS:
+        left, right = _eval_node(node.left, variables), _eval_node(node.right, variables)
+        result = BINARY_OPS[type(node.op)](left, right)
+        if np.size(result) > MAX_ELEMENTS:
+            raise ValueError(f"中间结果最多{MAX_ELEMENTS}个元素")
+        return result
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPS:
+        return UNARY_OPS[type(node.op)](_eval_node(node.operand, variables))
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in EXPRESSION_FUNCTIONS \
+            and not node.keywords and len(node.args) == 1:
+        return np.asarray(EXPRESSION_FUNCTIONS[node.func.id](_eval_node(node.args[0], variables)))
+    raise ValueError(f"表达式中不支持的语法：{ast.dump(node)[:50]}")
+
+
+@mcp.tool()
+async def evaluate(expression: str, variables: dict[str, float | list[float]] | None = None) -> float | list | None:
+    """
+    计算数学表达式，变量可以是数字或数字列表（按元素计算）
+    支持 + - * / // % **、括号和函数：abs sqrt exp log log10 sin cos tan round sum mean min max std cumsum，常量：pi e
+    :param expression: 例如 "sum(x * w) / sum(w)"
+    :param variables: 例如 {"x": [1, 2, 3], "w": [0.2, 0.3, 0.5]}
+    :return:
+    """
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"表达式最长{MAX_EXPRESSION_LENGTH}个字符")
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"表达式语法错误：{e.msg}")
+    if sum(1 for _ in ast.walk(tree)) > MAX_EXPRESSION_NODES:
+        raise ValueError("表达式过于复杂")
+    arrays = {name: _to_array(value, name) for name, value in (variables or {}).items()}
+    if sum(array.size for array in arrays.values()) > MAX_ELEMENTS:
+        raise ValueError(f"变量最多共{MAX_ELEMENTS}个元素")
+    with np.errstate(all="ignore"):
+        return _to_result(np.asarray(_eval_node(tree, arrays)))
+
+
 if __name__ == '__main__':
-    mcp.run(transport="stdio")
\ No newline at end of file
+    mcp.run(transport="stdio")
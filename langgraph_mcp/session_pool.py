@@ -0,0 +1,352 @@
+"""
+持久的MCP session池：
+MultiServerMCPClient.get_tools()返回的工具每次调用都会新建session，stdio服务每次都要启动一个子进程并重新握手。
+MCPSessionPool为每个服务保持长连接：
+1. stdio服务预先启动pool_size个子进程（每个子进程一个session），工具调用分配到当前并发最少的进程
+2. HTTP服务保持一个session
+3. 后台定期ping检查健康状态，进程崩溃或连接断开时重启；调用时连接断开会重启该worker后重试
+
+python -m langgraph_mcp.session_pool --calls 50 对比每次新建session和使用session池的单次调用耗时
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import os
+import signal
+import sys
+import time
+from typing import Any
+
+import anyio
+import httpx
+from langchain_core.tools import BaseTool
+from langchain_mcp_adapters.sessions import Connection
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+from mcp import ClientSession
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED, CallToolResult, Tool as MCPTool
+
+from langgraph_mcp.in_process import open_session
+from langgraph_mcp.tool_metrics import instrument_tool, mark_error, record_phase
+from multi_agent.stream_metrics import percentile
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """
+    进程退出或连接断开导致的错误（工具本身的错误在CallToolResult.isError中返回，不会抛异常）。
+    也检查ExceptionGroup中的异常和__cause__（agent执行工具时可能被包装）
+    """
+    if isinstance(error, BaseExceptionGroup):
+        return any(is_connection_error(e) for e in error.exceptions)
+    if isinstance(error, McpError):
+        return error.error.code == CONNECTION_CLOSED
+    if isinstance(error, (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, OSError,
+                          httpx.TransportError)):
+        return True
+    return error.__cause__ is not None and is_connection_error(error.__cause__)
+
+
+class SessionWorker:
+    """一个持久的MCP session（stdio服务对应一个子进程），session在单独的task中进入和退出"""
+
+    def __init__(self, server_name: str, connection: Connection):
+        self.server_name = server_name
+        self.connection = connection
+        self.session: ClientSession | None = None
+        self.inflight = 0
+        self.calls = 0
+        self.restarts = 0
+        # 每次建立新session加1，并发的调用同时发现连接断开时只重启一次
+        self.generation = 0
+        self._runner: asyncio.Task | None = None
+        self._closing: asyncio.Event | None = None
+        self._lock = asyncio.Lock()
+        self._restart_lock = asyncio.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self._runner is not None and not self._runner.done() and self.session is not None
+
+    async def _run(self, ready: asyncio.Future):
+        try:
+            async with open_session(self.connection) as session:
+                self.session = session
+                ready.set_result(None)
+                await self._closing.wait()
+        except BaseException as e:
+            if not ready.done():
+                ready.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            self.session = None
+
+    async def start(self):
+        async with self._lock:
+            if self.alive:
+                return
+            self._closing = asyncio.Event()
+            ready = asyncio.get_running_loop().create_future()
+            self._runner = asyncio.create_task(self._run(ready))
+            self.generation += 1
+            await ready
+
+    async def stop(self, timeout: float = 5.0):
+        runner = self._runner
+        if runner is None:
+            return
+        self._closing.set()
+        try:
+            await asyncio.wait_for(asyncio.gather(runner, return_exceptions=True), timeout)
+        except asyncio.TimeoutError:
+            runner.cancel()
+            await asyncio.gather(runner, return_exceptions=True)
+        self._runner = None
+
+    async def restart(self, generation: int | None = None):
+        """
+        :param generation: 发现连接断开时的session代数，已经被其他调用重启过时不再重启
+        """
+        async with self._restart_lock:
+            if generation is not None and generation != self.generation:
+                await self.start()
+                return
+            await self.stop()
+            self.restarts += 1
+            await self.start()
+
+    async def ping(self, timeout: float) -> bool:
+        session = self.session
+        if session is None or not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+    async def call_tool(self, name: str, arguments: dict[str, Any], **kwargs) -> CallToolResult:
+        with record_phase("connect"):
+            await self.start()
+        self.inflight += 1
+        try:
+            self.calls += 1
+            with record_phase("execute"):
+                result = await self.session.call_tool(name, arguments, **kwargs)
+            mark_error(result.isError)
+            return result
+        finally:
+            self.inflight -= 1
+
+
+class _PooledSession:
+    """传给convert_mcp_tool_to_langchain_tool的session：工具调用转发到session池"""
+
+    def __init__(self, pool: "MCPSessionPool", server_name: str):
+        self.pool = pool
+        self.server_name = server_name
+
+    async def call_tool(self, name: str, arguments: dict[str, Any] | None = None, **kwargs) -> CallToolResult:
+        return await self.pool.call_tool(self.server_name, name, arguments or {}, **kwargs)
+
+
+class MCPSessionPool:
+    """按服务保持持久session，stdio服务使用多个预先启动的子进程"""
+
+    def __init__(self, connections: dict[str, Connection], pool_sizes: dict[str, int] | None = None,
+                 health_interval: float = 30.0, ping_timeout: float = 5.0):
+        """
+        :param connections: 与MultiServerMCPClient相同的连接配置，另外支持in_process连接（见in_process.py）
+        :param pool_sizes: 服务名 -> worker数，stdio服务默认2个，其他服务默认1个
+        :param health_interval: 健康检查间隔（秒）
+        :param ping_timeout:
+        """
+        self.connections = connections
+        self.health_interval = health_interval
+        self.ping_timeout = ping_timeout
+        pool_sizes = pool_sizes or {}
+        self.workers: dict[str, list[SessionWorker]] = {
+            name: [SessionWorker(name, connection)
+                   for _ in range(pool_sizes.get(name, 2 if connection.get("transport") == "stdio" else 1))]
+            for name, connection in connections.items()
+        }
+        self._round_robin = {name: itertools.count() for name in connections}
+        self._health_task: asyncio.Task | None = None
+        self.connection_errors = 0
+        self.retries = 0
+
+    async def start(self, server_name: str | None = None):
+        """预先启动worker（stdio服务会启动子进程），并开始健康检查"""
+        server_names = [server_name] if server_name else list(self.workers)
+        await asyncio.gather(*(worker.start() for name in server_names for worker in self.workers[name]))
+        self._ensure_health_check()
+
+    def _ensure_health_check(self):
+        if self.health_interval and (self._health_task is None or self._health_task.done()):
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    async def check_health(self) -> dict[str, list[bool]]:
+        """ping所有已经启动过的worker，失败的重启"""
+        result = {}
+        for name, workers in self.workers.items():
+            result[name] = []
+            for worker in workers:
+                if worker._runner is None:
+                    # 还没有启动过的worker不检查，保持懒加载
+                    result[name].append(True)
+                    continue
+                generation = worker.generation
+                healthy = await worker.ping(self.ping_timeout)
+                if not healthy:
+                    self.connection_errors += 1
+                    try:
+                        await worker.restart(generation)
+                    except Exception as e:
+                        print(f"重启{name}的MCP worker失败：{e}")
+                result[name].append(healthy)
+        return result
+
+    def _pick(self, server_name: str, exclude: SessionWorker | None = None) -> SessionWorker:
+        """优先选择存活并且并发最少的worker，并发相同时轮询"""
+        workers = [worker for worker in self.workers[server_name] if worker is not exclude] or \
+            self.workers[server_name]
+        offset = next(self._round_robin[server_name]) % len(workers)
+        workers = workers[offset:] + workers[:offset]
+        return min(workers, key=lambda worker: (not worker.alive, worker.inflight))
+
+    async def call_tool(self, server_name: str, name: str, arguments: dict[str, Any], **kwargs) -> CallToolResult:
+        """
+        调用工具；worker的进程崩溃或连接断开时重启该worker后重试，最多每个worker重试一次
+        """
+        self._ensure_health_check()
+        attempts = len(self.workers[server_name]) + 1
+        for attempt in range(attempts):
+            worker = self._pick(server_name)
+            generation = worker.generation
+            try:
+                return await worker.call_tool(name, arguments, **kwargs)
+            except Exception as e:
+                if not is_connection_error(e) or attempt == attempts - 1:
+                    raise
+                self.connection_errors += 1
+                self.retries += 1
+                await worker.restart(generation)
+
+    async def list_tools(self, server_name: str) -> list[MCPTool]:
+        worker = self._pick(server_name)
+        await worker.start()
+        tools, cursor = [], None
+        while True:
+            page = await worker.session.list_tools(cursor=cursor)
+            tools.extend(page.tools)
+            cursor = page.nextCursor
+            if not cursor:
+                return tools
+
+    def tool(self, server_name: str, tool: MCPTool) -> BaseTool:
+        """创建通过session池调用的LangChain工具，调用耗时记录在tool_metrics中"""
+        return instrument_tool(
+            convert_mcp_tool_to_langchain_tool(_PooledSession(self, server_name), tool, server_name=server_name),
+            server_name)
+
+    async def get_tools(self, server_name: str | None = None) -> list[BaseTool]:
+        server_names = [server_name] if server_name else list(self.workers)
+        tools = []
+        for name in server_names:
+            tools.extend(self.tool(name, tool) for tool in await self.list_tools(name))
+        return tools
+
+    async def aclose(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        await asyncio.gather(*(worker.stop() for workers in self.workers.values() for worker in workers))
+
+    def stats(self) -> dict:
+        return {
+            name: {
+                "workers": len(workers),
+                "alive": sum(worker.alive for worker in workers),
+                "calls": sum(worker.calls for worker in workers),
+                "inflight": sum(worker.inflight for worker in workers),
+                "restarts": sum(worker.restarts for worker in workers),
+            }
+            for name, workers in self.workers.items()
+        } | {"connection_errors": self.connection_errors, "retries": self.retries}
+
+
+async def _bench(calls: int, pool_size: int):
+    from langchain_mcp_adapters.client import MultiServerMCPClient
+
+    connections: dict[str, Connection] = {
+        "math": {
+            "command": sys.executable,
+            "args": [os.path.join(os.path.dirname(os.path.abspath(__file__)), "math_server.py")],
+            "transport": "stdio",
+        }
+    }
+
+    async def _measure(tool: BaseTool, count: int) -> list[float]:
+        latencies = []
+        for i in range(count):
+            start = time.perf_counter()
+            await tool.ainvoke({"a": i, "b": 1})
+            latencies.append(time.perf_counter() - start)
+        return sorted(latencies)
+
+    client_tools = await MultiServerMCPClient(connections).get_tools()
+    per_session = await _measure(next(tool for tool in client_tools if tool.name == "add"), min(calls, 10))
+
+    pool = MCPSessionPool(connections, pool_sizes={"math": pool_size})
+    start = time.perf_counter()
+    await pool.start()
+    warmup = time.perf_counter() - start
+    pool_tool = next(tool for tool in await pool.get_tools() if tool.name == "add")
+    pooled = await _measure(pool_tool, calls)
+
+    # 模拟子进程崩溃：杀掉一个math_server子进程，健康检查发现后自动重启
+    pids = _math_server_pids()
+    if pids:
+        os.kill(pids[0], signal.SIGKILL)
+        await asyncio.sleep(0.2)
+        print(f"杀掉子进程{pids[0]}后的健康检查：{await pool.check_health()}")
+        await pool_tool.ainvoke({"a": 1, "b": 2})
+
+    print(f"每次新建session：p50 {percentile(per_session, 50) * 1000:.1f}ms，"
+          f"p95 {percentile(per_session, 95) * 1000:.1f}ms（{len(per_session)}次）")
+    print(f"session池（{pool_size}个进程，预热 {warmup * 1000:.0f}ms）：p50 {percentile(pooled, 50) * 1000:.2f}ms，"
+          f"p95 {percentile(pooled, 95) * 1000:.2f}ms（{len(pooled)}次）")
+    print(f"统计：{pool.stats()}")
+    await pool.aclose()
+
+
+def _math_server_pids() -> list[int]:
+    """当前进程启动的math_server子进程（读取/proc，仅Linux，用于演示崩溃重启）"""
+    pids = []
+    for children in glob.glob("/proc/self/task/*/children"):
+        with open(children) as f:
+            pids.extend(int(pid) for pid in f.read().split())
+    result = []
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                if b"math_server.py" in f.read():
+                    result.append(pid)
+        except OSError:
+            continue
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--pool-size", type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(_bench(args.calls, args.pool_size))
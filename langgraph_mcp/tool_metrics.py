@@ -0,0 +1,235 @@
+"""
+MCP工具调用的耗时统计：
+按服务和工具统计调用次数、错误次数和耗时直方图，耗时拆分为：
+1. connect：获取session的时间（session池中worker还没有启动时包含启动子进程/建立连接）
+2. execute：session.call_tool的往返时间（包含传输和服务端执行）
+3. serialize：其余时间，即参数校验和结果转换
+只有经过MCPSessionPool或InstrumentedSession的调用才能拆分，其他调用的全部耗时记为execute
+
+导出：to_prometheus()返回Prometheus文本格式，to_json()返回JSON
+关闭（MCP_TOOL_METRICS=0或metrics.enabled = False）时每次调用只多一次属性判断
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterable
+
+from langchain_core.tools import BaseTool
+
+# 直方图的桶上限（秒）
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ("connect", "serialize", "execute", "total")
+
+# 当前工具调用各阶段的耗时，由被包装的工具设置，session池和InstrumentedSession写入
+_current_phases: ContextVar[dict[str, Any] | None] = ContextVar("mcp_tool_phases", default=None)
+
+
+@contextmanager
+def record_phase(name: str):
+    """在工具调用内部记录一个阶段的耗时，不在被统计的工具调用中时不做任何事"""
+    phases = _current_phases.get()
+    if phases is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def mark_error(is_error: bool):
+    """记录CallToolResult.isError（工具执行错误不会抛异常）"""
+    phases = _current_phases.get()
+    if phases is not None and is_error:
+        phases["is_error"] = True
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            index = len(self.buckets)
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "Histogram"):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.sum += other.sum
+        self.count += other.count
+
+    def quantile(self, q: float) -> float | None:
+        """按桶估计分位数（返回所在桶的上限）"""
+        if not self.count:
+            return None
+        target, cumulative = q * self.count, 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class _Series:
+    """一个工具的统计"""
+
+    def __init__(self, buckets: tuple[float, ...]):
+        self.calls = 0
+        self.errors = 0
+        self.histograms = {phase: Histogram(buckets) for phase in PHASES}
+
+
+class ToolMetrics:
+    def __init__(self, enabled: bool = True, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # (服务名, 工具名) -> 统计
+        self._series: dict[tuple[str, str], _Series] = {}
+
+    def record(self, server: str, tool: str, total: float, phases: dict[str, Any], error: bool):
+        connect = phases.get("connect", 0.0)
+        execute = phases.get("execute", total - connect)
+        values = {"connect": connect, "execute": execute, "serialize": max(0.0, total - connect - execute),
+                  "total": total}
+        with self._lock:
+            series = self._series.get((server, tool))
+            if series is None:
+                series = self._series[(server, tool)] = _Series(self.buckets)
+            series.calls += 1
+            if error or phases.get("is_error"):
+                series.errors += 1
+            for phase, value in values.items():
+                series.histograms[phase].observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def _server_series(self) -> dict[str, _Series]:
+        servers: dict[str, _Series] = {}
+        for (server, _), series in self._series.items():
+            merged = servers.setdefault(server, _Series(self.buckets))
+            merged.calls += series.calls
+            merged.errors += series.errors
+            for phase in PHASES:
+                merged.histograms[phase].merge(series.histograms[phase])
+        return servers
+
+    def to_json(self) -> dict:
+        def _summary(series: _Series) -> dict:
+            return {
+                "calls": series.calls,
+                "errors": series.errors,
+                "phases": {
+                    phase: {
+                        "count": histogram.count,
+                        "sum_ms": histogram.sum * 1000,
+                        "mean_ms": histogram.sum / histogram.count * 1000 if histogram.count else 0.0,
+                        "p50_le_ms": (histogram.quantile(0.5) or 0.0) * 1000,
+                        "p95_le_ms": (histogram.quantile(0.95) or 0.0) * 1000,
+                        "buckets": dict(zip([str(bound) for bound in self.buckets] + ["+Inf"], histogram.counts)),
+                    }
+                    for phase, histogram in series.histograms.items()
+                },
+            }
+
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "tools": [{"server": server, "tool": tool, **_summary(series)}
+                          for (server, tool), series in sorted(self._series.items())],
+                "servers": {server: _summary(series) for server, series in sorted(self._server_series().items())},
+            }
+
+    def to_prometheus(self, prefix: str = "mcp_tool") -> str:
+        lines = [
+            f"# HELP {prefix}_calls_total MCP tool calls",
+            f"# TYPE {prefix}_calls_total counter",
+        ]
+        with self._lock:
+            items = sorted(self._series.items())
+            for (server, tool), series in items:
+                lines.append(f'{prefix}_calls_total{{server="{server}",tool="{tool}"}} {series.calls}')
+            lines += [f"# HELP {prefix}_errors_total MCP tool calls that raised or returned isError",
+                      f"# TYPE {prefix}_errors_total counter"]
+            for (server, tool), series in items:
+                lines.append(f'{prefix}_errors_total{{server="{server}",tool="{tool}"}} {series.errors}')
+            lines += [f"# HELP {prefix}_duration_seconds MCP tool call latency by phase",
+                      f"# TYPE {prefix}_duration_seconds histogram"]
+            for (server, tool), series in items:
+                for phase, histogram in series.histograms.items():
+                    labels = f'server="{server}",tool="{tool}",phase="{phase}"'
+                    cumulative = 0
+                    for bound, count in zip([str(bound) for bound in self.buckets] + ["+Inf"], histogram.counts):
+                        cumulative += count
+                        lines.append(f'{prefix}_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f"{prefix}_duration_seconds_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{prefix}_duration_seconds_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+tool_metrics = ToolMetrics(enabled=os.environ.get("MCP_TOOL_METRICS", "1") != "0")
+
+
+def instrument_tool(tool: BaseTool, server_name: str, metrics: ToolMetrics = tool_metrics) -> BaseTool:
+    """
+    返回记录耗时的工具副本（只包装异步调用，MCP工具只支持异步调用）
+    :param tool: convert_mcp_tool_to_langchain_tool等创建的StructuredTool
+    :param server_name:
+    :param metrics:
+    :return:
+    """
+    call_tool = getattr(tool, "coroutine", None)
+    if call_tool is None:
+        return tool
+
+    async def _timed_call(*args, **kwargs):
+        if not metrics.enabled:
+            return await call_tool(*args, **kwargs)
+        phases: dict[str, Any] = {}
+        token = _current_phases.set(phases)
+        start = time.perf_counter()
+        error = False
+        try:
+            return await call_tool(*args, **kwargs)
+        except BaseException:
+            error = True
+            raise
+        finally:
+            _current_phases.reset(token)
+            metrics.record(server_name, tool.name, time.perf_counter() - start, phases, error)
+
+    return tool.model_copy(update={"coroutine": _timed_call})
+
+
+def instrument_tools(tools: Iterable[BaseTool], server_name: str, metrics: ToolMetrics = tool_metrics) -> list[BaseTool]:
+    return [instrument_tool(tool, server_name, metrics) for tool in tools]
+
+
+class InstrumentedSession:
+    """包装ClientSession，call_tool的耗时记为execute，其他属性直接转发（用于load_mcp_tools(session)创建的工具）"""
+
+    def __init__(self, session):
+        self._session = session
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    async def call_tool(self, *args, **kwargs):
+        with record_phase("execute"):
+            result = await self._session.call_tool(*args, **kwargs)
+        mark_error(result.isError)
+        return result
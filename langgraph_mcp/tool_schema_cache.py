@@ -0,0 +1,236 @@
+"""
+MCP工具schema的磁盘缓存，以及懒连接：
+1. 每个MCP服务的工具schema按服务指纹（连接配置+stdio服务脚本的修改时间和大小）缓存在本地JSON文件中
+2. 缓存命中时直接用缓存的schema创建工具，启动时不启动stdio服务、不连接HTTP服务，第一次调用工具时才建立连接
+3. 服务的工具第一次被调用时，在后台重新获取schema，与缓存不一致时更新缓存（下次启动生效）
+4. 缓存未命中时连接服务获取schema并写入缓存
+
+测量冷启动耗时（需要时先启动weather_server）：
+python -m langgraph_mcp.tool_schema_cache --weather-url http://localhost:8000/mcp
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Any
+
+from langchain_core.tools import BaseTool
+from langchain_mcp_adapters.sessions import Connection
+from langchain_mcp_adapters.tools import convert_mcp_tool_to_langchain_tool
+from mcp.types import Tool as MCPTool
+
+from langgraph_mcp.in_process import IN_PROCESS, module_file, open_session
+from langgraph_mcp.tool_metrics import instrument_tool
+
+
+def server_fingerprint(connection: Connection) -> str:
+    """
+    服务指纹：连接配置的哈希，stdio服务还包含参数中脚本文件的修改时间和大小，进程内服务包含模块文件的修改时间和大小，
+    修改服务代码后缓存失效
+    :param connection:
+    :return:
+    """
+    parts: list[Any] = [json.dumps(connection, sort_keys=True, default=str)]
+    files = []
+    if connection.get("transport") == "stdio":
+        files = [arg for arg in connection.get("args", []) if os.path.isfile(arg)]
+    elif connection.get("transport") == IN_PROCESS:
+        files = [path for path in [module_file(connection)] if path]
+    for path in files:
+        stat = os.stat(path)
+        parts.append([path, stat.st_mtime_ns, stat.st_size])
+    return hashlib.sha1(json.dumps(parts, default=str).encode("utf-8")).hexdigest()
+
+
+async def list_server_tools(connection: Connection) -> list[MCPTool]:
+    """连接服务获取所有工具（支持分页）"""
+    async with open_session(connection) as session:
+        tools, cursor = [], None
+        while True:
+            page = await session.list_tools(cursor=cursor)
+            tools.extend(page.tools)
+            cursor = page.nextCursor
+            if not cursor:
+                return tools
+
+
+class ToolSchemaCache:
+    """{服务指纹: {"server", "tools", "saved_at"}}，保存在JSON文件中"""
+
+    def __init__(self, path: str = "mcp_tool_schemas.json"):
+        self.path = path
+        self._data: dict[str, dict] = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"加载工具schema缓存失败：{e}")
+
+    def get(self, fingerprint: str) -> list[MCPTool] | None:
+        entry = self._data.get(fingerprint)
+        if entry is None:
+            return None
+        return [MCPTool.model_validate(tool) for tool in entry["tools"]]
+
+    def put(self, fingerprint: str, server_name: str, tools: list[MCPTool]):
+        # 同一个服务只保留最新指纹的缓存
+        self._data = {key: entry for key, entry in self._data.items() if entry["server"] != server_name}
+        self._data[fingerprint] = {
+            "server": server_name,
+            "tools": [tool.model_dump(mode="json", exclude_none=True) for tool in tools],
+            "saved_at": time.time(),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class CachedToolLoader:
+    """代替MultiServerMCPClient.get_tools()：优先使用缓存的schema创建懒连接的工具"""
+
+    def __init__(self, connections: dict[str, Connection], cache: ToolSchemaCache, session_pool=None):
+        """
+        :param connections:
+        :param cache:
+        :param session_pool: 可选的MCPSessionPool，工具调用和重新获取schema都使用池中的持久session
+        """
+        self.connections = connections
+        self.cache = cache
+        self.session_pool = session_pool
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.changed = 0
+        # 服务名 -> 后台重新获取schema的任务，每个服务只执行一次，刚从服务获取schema时为None
+        self._revalidate_tasks: dict[str, asyncio.Task | None] = {}
+
+    async def _revalidate(self, server_name: str, fingerprint: str, cached: list[MCPTool]):
+        try:
+            tools = await self._list_tools(server_name)
+        except Exception as e:
+            print(f"重新获取{server_name}的工具schema失败：{e}")
+            return
+        self.revalidations += 1
+        if [tool.model_dump(mode="json", exclude_none=True) for tool in tools] != \
+                [tool.model_dump(mode="json", exclude_none=True) for tool in cached]:
+            self.changed += 1
+            self.cache.put(fingerprint, server_name, tools)
+            print(f"{server_name}的工具schema已变化，已更新缓存，重启后生效")
+
+    async def _list_tools(self, server_name: str) -> list[MCPTool]:
+        if self.session_pool is not None:
+            return await self.session_pool.list_tools(server_name)
+        return await list_server_tools(self.connections[server_name])
+
+    def _tool(self, server_name: str, tool: MCPTool) -> BaseTool:
+        if self.session_pool is not None:
+            return self.session_pool.tool(server_name, tool)
+        if self.connections[server_name].get("transport") == IN_PROCESS:
+            raise ValueError(f"{server_name}是进程内连接，需要配合MCPSessionPool使用")
+        return instrument_tool(convert_mcp_tool_to_langchain_tool(None, tool, connection=self.connections[server_name],
+                                                                  server_name=server_name), server_name)
+
+    def _lazy_tool(self, server_name: str, fingerprint: str, tool: MCPTool, cached: list[MCPTool]) -> BaseTool:
+        """用缓存的schema创建工具：调用时才连接服务；第一次调用时在后台重新获取schema"""
+        langchain_tool = self._tool(server_name, tool)
+        call_tool = langchain_tool.coroutine
+
+        async def _call_and_revalidate(*args, **kwargs):
+            if server_name not in self._revalidate_tasks:
+                self._revalidate_tasks[server_name] = asyncio.create_task(
+                    self._revalidate(server_name, fingerprint, cached))
+            return await call_tool(*args, **kwargs)
+
+        langchain_tool.coroutine = _call_and_revalidate
+        return langchain_tool
+
+    async def _server_tools(self, server_name: str) -> list[BaseTool]:
+        connection = self.connections[server_name]
+        fingerprint = server_fingerprint(connection)
+        cached = self.cache.get(fingerprint)
+        if cached is not None:
+            self.hits += 1
+            return [self._lazy_tool(server_name, fingerprint, tool, cached) for tool in cached]
+        self.misses += 1
+        tools = await self._list_tools(server_name)
+        self.cache.put(fingerprint, server_name, tools)
+        # 刚获取的schema不需要再重新验证
+        self._revalidate_tasks[server_name] = None
+        return [self._tool(server_name, tool) for tool in tools]
+
+    async def get_tools(self, server_name: str | None = None) -> list[BaseTool]:
+        """
+        :param server_name: 只获取一个服务的工具，不传时获取所有服务的工具
+        :return:
+        """
+        server_names = [server_name] if server_name else list(self.connections)
+        results = await asyncio.gather(*(self._server_tools(name) for name in server_names))
+        return [tool for tools in results for tool in tools]
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "revalidations": self.revalidations,
+                "changed": self.changed}
+
+
+async def measure_cold_start(connections: dict[str, Connection], cache_path: str) -> dict:
+    """
+    对比直接连接获取工具和使用缓存的启动耗时
+    :return: {"eager_ms", "cold_cache_ms", "warm_cache_ms", "first_call_ms"}
+    """
+    from langchain_mcp_adapters.client import MultiServerMCPClient
+
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    start = time.perf_counter()
+    await MultiServerMCPClient(connections).get_tools()
+    eager = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await CachedToolLoader(connections, ToolSchemaCache(cache_path)).get_tools()
+    cold_cache = time.perf_counter() - start
+
+    start = time.perf_counter()
+    loader = CachedToolLoader(connections, ToolSchemaCache(cache_path))
+    tools = await loader.get_tools()
+    warm_cache = time.perf_counter() - start
+
+    result = {"tools": len(tools), "eager_ms": eager * 1000, "cold_cache_ms": cold_cache * 1000,
+              "warm_cache_ms": warm_cache * 1000}
+    add_tool = next((tool for tool in tools if tool.name == "add"), None)
+    if add_tool is not None:
+        start = time.perf_counter()
+        await add_tool.ainvoke({"a": 1, "b": 2})
+        result["first_call_ms"] = (time.perf_counter() - start) * 1000
+    await asyncio.gather(*(task for task in loader._revalidate_tasks.values() if task is not None))
+    result["loader"] = loader.stats()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weather-url", help="streamable-http的weather服务地址，不传时只测量math服务")
+    parser.add_argument("--cache-path", default="mcp_tool_schemas.bench.json")
+    args = parser.parse_args()
+    connections: dict[str, Connection] = {
+        "math": {
+            "command": sys.executable,
+            "args": [os.path.join(os.path.dirname(os.path.abspath(__file__)), "math_server.py")],
+            "transport": "stdio",
+        }
+    }
+    if args.weather_url:
+        connections["weather"] = {"url": args.weather_url, "transport": "streamable_http"}
+    result = asyncio.run(measure_cold_start(connections, args.cache_path))
+    print(f"工具数：{result['tools']}")
+    print(f"直接连接获取工具：{result['eager_ms']:.1f}ms")
+    print(f"缓存未命中（连接并写入缓存）：{result['cold_cache_ms']:.1f}ms")
+    print(f"缓存命中（不连接）：{result['warm_cache_ms']:.1f}ms")
+    if "first_call_ms" in result:
+        print(f"缓存命中后第一次调用add（建立连接）：{result['first_call_ms']:.1f}ms")
+    print(f"统计：{result['loader']}")
+    os.remove(args.cache_path)
@@ -1,16 +1,19 @@
 import asyncio
 import os
+import sys
 import threading
-from typing import Sequence
+import time
 
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
-from langchain_core.messages import trim_messages
-from langchain_core.messages.utils import count_tokens_approximately
-from langchain_core.tools import BaseTool
-from langchain_mcp_adapters.client import MultiServerMCPClient
 from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import InMemorySaver
+
+from langgraph_agent.incremental_trim import IncrementalTrimmer
+from langgraph_checkpoint.bounded_saver import BoundedInMemorySaver
+from langgraph_mcp.in_process import in_process_connection
+from langgraph_mcp.session_pool import MCPSessionPool
+from langgraph_mcp.tool_metrics import tool_metrics
+from langgraph_mcp.tool_schema_cache import CachedToolLoader, ToolSchemaCache
 
 
 load_dotenv()
@@ -20,8 +23,8 @@ model = init_chat_model(model="gpt-4",
 
 mcp_config = {
     "math": {
-        "command": "python",
-        "args": ["D:\\workspace\\py\\PythonProject\\langgraph_demo\\langgraph_mcp\\math_server.py"],
+        "command": sys.executable,
+        "args": [os.path.join(os.path.dirname(os.path.abspath(__file__)), "math_server.py")],
         "transport": "stdio"
     },
     "weather": {
@@ -30,38 +33,41 @@ mcp_config = {
     }
 }
 
+# MCP_IN_PROCESS=1时在当前进程中加载math服务，通过内存流调用，不启动子进程
+if os.environ.get("MCP_IN_PROCESS") == "1":
+    mcp_config["math"] = in_process_connection("langgraph_mcp.math_server")
+
 config = {
     "configurable": {
         "thread_id": threading.current_thread().ident
     }
 }
 
-def pre_model_hook(state):
-    trimmed_messages = trim_messages(
-        state["messages"],
-        strategy="last",
-        token_counter=count_tokens_approximately,
-        max_tokens=384,
-        start_on="human",
-        end_on=("human", "tool"),
-    )
-    return {"llm_input_messages": trimmed_messages}
+# 与trim_messages(strategy="last", token_counter=count_tokens_approximately)结果相同，但每轮只计算新增消息的token数
+pre_model_hook = IncrementalTrimmer(max_tokens=384, start_on="human", end_on=("human", "tool"))
 
-checkpointer = InMemorySaver()
+checkpointer = BoundedInMemorySaver(max_threads=1000, ttl=3600, keep_last=5)
 
-mcp_client = MultiServerMCPClient(connections=mcp_config)
+# 每个MCP服务保持持久session，stdio的math服务默认启动2个子进程，工具调用分配到不同进程
+session_pool = MCPSessionPool(mcp_config)
+# 工具schema缓存在本地，启动时不连接MCP服务，第一次调用工具时才连接
+tool_loader = CachedToolLoader(mcp_config, ToolSchemaCache("mcp_tool_schemas.json"), session_pool=session_pool)
 
-async def get_mcp_tools(client:MultiServerMCPClient) -> Sequence[BaseTool]:
-    mcp_tools = await client.get_tools()
-    return mcp_tools
+async def warmup_session_pool(server_name: str):
+    try:
+        await session_pool.start(server_name)
+    except Exception as e:
+        print(f"预热{server_name}服务失败：{e}")
 
 async def main():
-    mcp_tools = await get_mcp_tools(mcp_client)
+    start = time.perf_counter()
+    mcp_tools = await tool_loader.get_tools()
     print(mcp_tools)
+    print(f"加载工具耗时：{(time.perf_counter() - start) * 1000:.1f}ms，schema缓存：{tool_loader.stats()}")
     agent = create_react_agent(
         model=model,
         tools=mcp_tools,
-        prompt="你是一个聪明的人工智能助手",
+        prompt="你是一个聪明的人工智能助手。查询多个地点的天气预报或多个州的天气预警时，使用get_forecasts/get_alerts_many一次查询全部",
         checkpointer=checkpointer,
         pre_model_hook=pre_model_hook,
     )
@@ -72,13 +78,22 @@ async def main():
             for item in val:
                 print(f"type: {type(item)}, value: {item}")
 
-    while True:
-        query = input("请输入你的问题：")
-        message = {"messages": [{"role": "user", "content": query}]}
-        # 必须使用异步调用
-        invoke = await agent.ainvoke(message, config=config)
-        print_invoke(invoke)
-        print("=="*20)
+    # 等待用户输入时在后台预先启动math服务的子进程，不影响启动耗时
+    warmup = asyncio.create_task(warmup_session_pool("math"))
+    try:
+        while True:
+            # 在线程中等待输入，不阻塞事件循环中的预热和健康检查
+            query = await asyncio.to_thread(input, "请输入你的问题：")
+            message = {"messages": [{"role": "user", "content": query}]}
+            # 必须使用异步调用
+            invoke = await agent.ainvoke(message, config=config)
+            print_invoke(invoke)
+            print(f"MCP session池：{session_pool.stats()}")
+            print("=="*20)
+    finally:
+        warmup.cancel()
+        await session_pool.aclose()
+        print(tool_metrics.to_prometheus())
 
 if __name__ == '__main__':
     asyncio.run(main())
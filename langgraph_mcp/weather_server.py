@@ -1,34 +1,316 @@
+import asyncio
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
 from typing import Any
 
 import httpx
 from mcp.server import FastMCP
 
-BASER_URL = "https://api.weather.gov"
+# 可以通过NWS_BASE_URL指向本地的fake_nws_server，不访问外网
+BASER_URL = os.environ.get("NWS_BASE_URL", "https://api.weather.gov")
 USER_AGENT = "weather-app/1.0"
 mcp = FastMCP(
-    host="localhost",
-    port=8000,
+    host=os.environ.get("WEATHER_MCP_HOST", "localhost"),
+    port=int(os.environ.get("WEATHER_MCP_PORT", 8000)),
 )
 
-async def make_nws_request(url:str)-> dict[str, Any] | None:
+# ------------------------------
+# 共享的HTTP客户端：整个服务生命周期内复用连接（keep-alive），不用每次请求都重新建立TCP+TLS连接
+# ------------------------------
+HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=30)
+HTTP_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+# 5xx和429时重试的次数，以及指数退避的基础等待时间（秒）
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+# 单次重试最多等待的时间（秒），上游的Retry-After超过该值时直接放弃，不让一次工具调用等待几分钟
+MAX_BACKOFF = 10.0
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_http_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """懒加载共享的AsyncClient，第一次请求时创建"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            headers={
+                "User-Agent": USER_AGENT,
+                "Accept": "application/geo+json",
+            },
+            limits=HTTP_LIMITS,
+            timeout=HTTP_TIMEOUT,
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """服务停止时关闭连接池"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def _retry_delay(attempt: int, response: httpx.Response | None) -> float | None:
+    """
+    重试前的等待时间：429优先使用Retry-After，否则为带随机抖动的指数退避（full jitter），最多MAX_BACKOFF秒
+    :param attempt: 第几次重试，从0开始
+    :param response: 失败的响应，连接错误时为None
+    :return: 等待的秒数，Retry-After超过MAX_BACKOFF时返回None（放弃重试）
+    """
+    if response is not None and response.status_code == 429:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return float(retry_after) if float(retry_after) <= MAX_BACKOFF else None
+    return min(MAX_BACKOFF, random.uniform(0, RETRY_BACKOFF * 2 ** attempt))
+
+
+# ------------------------------
+# 并发控制：每个host同时进行的请求数上限，以及所有请求共享的限流（令牌桶）
+# ------------------------------
+PER_HOST_CONCURRENCY = int(os.environ.get("NWS_PER_HOST_CONCURRENCY", 16))
+RATE_LIMIT = float(os.environ.get("NWS_RATE_LIMIT", 10.0))
+RATE_BURST = int(os.environ.get("NWS_RATE_BURST", 20))
+
+
+class RateLimiter:
+    """令牌桶：平均每秒rate个请求，最多允许burst个突发请求"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+rate_limiter = RateLimiter(RATE_LIMIT, RATE_BURST)
+_host_semaphores: dict[str, asyncio.Semaphore] = {}
+
+
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    host = httpx.URL(url).host
+    if host not in _host_semaphores:
+        _host_semaphores[host] = asyncio.Semaphore(PER_HOST_CONCURRENCY)
+    return _host_semaphores[host]
+
+
+async def _nws_get(url: str, headers: dict | None = None) -> httpx.Response | None:
     """
-    查询天气信息
+    GET请求，5xx/429和连接错误时按退避策略重试
     :param url:
-    :return:
+    :param headers: 额外的请求头（例如条件请求的If-None-Match）
+    :return: 200/304响应，失败时返回None
     """
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/geo+json",
-    }
+    client = get_http_client()
+    for attempt in range(MAX_RETRIES + 1):
+        response = None
+        try:
+            async with _host_semaphore(url):
+                await rate_limiter.acquire()
+                response = await client.get(url, headers=headers)
+        except httpx.TransportError as e:
+            error = f"{type(e).__name__}: {e}"
+        else:
+            if response.status_code in (200, 304):
+                return response
+            error = f"Error: {response.status_code}"
+            if response.status_code not in RETRY_STATUS:
+                break
+        if attempt < MAX_RETRIES:
+            delay = _retry_delay(attempt, response)
+            if delay is None:
+                error += f" (Retry-After {response.headers['Retry-After']}s > {MAX_BACKOFF}s)"
+                break
+            await asyncio.sleep(delay)
+    print(error)
+    return None
+
+
+# ------------------------------
+# 响应缓存：
+# 1. points（坐标 -> 预报网格）几乎不会变化，按取整后的坐标长期缓存
+# 2. forecast和alerts按响应的Cache-Control/Expires缓存，过期后用ETag/Last-Modified发条件请求，304时继续使用缓存
+# 3. 设置NWS_CACHE_PATH时，服务停止时把缓存写入磁盘，重启后加载，不用冷启动
+# ------------------------------
+POINTS_TTL = 7 * 24 * 3600
+# points请求的坐标保留的小数位数，2位约1公里，小于预报网格（2.5公里）
+POINTS_PRECISION = 2
+# 响应没有缓存相关的头时的缓存时间（秒）
+DEFAULT_TTL = 60
 
-    async with httpx.AsyncClient(headers=headers) as client:
-        response = await client.get(url)
-        if response.status_code == 200:
-            return response.json()
+
+def response_ttl(response: httpx.Response) -> float | None:
+    """
+    根据Cache-Control/Expires计算缓存时间
+    :return: 缓存秒数，no-store时返回None（不缓存）
+    """
+    cache_control = response.headers.get("Cache-Control", "").lower()
+    directives = {}
+    for item in cache_control.split(","):
+        name, _, value = item.strip().partition("=")
+        directives[name] = value.strip('"')
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    for name in ("s-maxage", "max-age"):
+        if directives.get(name, "").isdigit():
+            return float(directives[name])
+    if "Expires" in response.headers:
+        try:
+            expires = parsedate_to_datetime(response.headers["Expires"]).timestamp()
+            date = parsedate_to_datetime(response.headers["Date"]).timestamp() if "Date" in response.headers \
+                else time.time()
+        except (TypeError, ValueError):
+            return 0
+        return max(0.0, expires - date)
+    return DEFAULT_TTL
+
+
+class NWSCache:
+    """按URL缓存NWS响应，LRU淘汰，过期后条件请求重新验证"""
+
+    def __init__(self, max_entries: int = 10000, path: str | None = None):
+        self.max_entries = max_entries
+        self.path = path
+        # url -> {"data", "expires"（时间戳）, "etag", "last_modified"}
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.stale_served = 0
+        self.coalesced = 0
+        # url -> 正在进行的请求，同一个URL同时只发一个请求
+        self._inflight: dict[str, asyncio.Task] = {}
+        if path:
+            self.load()
+
+    def _store(self, url: str, entry: dict):
+        self._entries[url] = entry
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, url: str, ttl: float | None = None) -> dict[str, Any] | None:
+        """
+        :param url:
+        :param ttl: 固定的缓存时间，不传时按响应头计算
+        :return: 响应JSON，请求失败并且没有缓存时返回None
+        """
+        entry = self._entries.get(url)
+        if entry is not None and entry["expires"] > time.time():
+            self.hits += 1
+            self._entries.move_to_end(url)
+            return entry["data"]
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(url, entry, ttl))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
         else:
-            print(f"Error: {response.status_code}")
+            self.coalesced += 1
+        # 一个调用方被取消时不影响其他等待同一个请求的调用方
+        return await asyncio.shield(task)
+
+    async def _fetch(self, url: str, entry: dict | None, ttl: float | None) -> dict[str, Any] | None:
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        response = await _nws_get(url, headers=headers or None)
+        if response is None:
+            if entry is not None:
+                # 上游失败时继续使用过期的缓存
+                self.stale_served += 1
+                return entry["data"]
+            self.misses += 1
             return None
 
+        if response.status_code == 304 and entry is not None:
+            self.revalidated += 1
+            data = entry["data"]
+        else:
+            self.misses += 1
+            data = response.json()
+        entry_ttl = ttl if ttl is not None else response_ttl(response)
+        if entry_ttl is None:
+            self._entries.pop(url, None)
+        else:
+            self._store(url, {
+                "data": data,
+                "expires": time.time() + entry_ttl,
+                "etag": response.headers.get("ETag") or (entry or {}).get("etag"),
+                "last_modified": response.headers.get("Last-Modified") or (entry or {}).get("last_modified"),
+            })
+        return data
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"加载缓存失败：{e}")
+            return
+        for url, entry in entries.items():
+            self._store(url, entry)
+
+    def save(self):
+        """写入临时文件后替换，避免写到一半时进程退出损坏缓存文件"""
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(dict(self._entries), f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def stats(self) -> dict:
+        # 合并到同一个请求的调用也算作没有访问上游
+        lookups = self.hits + self.misses + self.revalidated + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "stale_served": self.stale_served,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.revalidated + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+nws_cache = NWSCache(path=os.environ.get("NWS_CACHE_PATH"))
+
+
+async def make_nws_request(url:str, ttl: float | None = None)-> dict[str, Any] | None:
+    """
+    查询天气信息（经过缓存）
+    :param url:
+    :param ttl: 固定的缓存时间，不传时按响应头计算
+    :return:
+    """
+    return await nws_cache.get(url, ttl=ttl)
+
+
 def format_alert(feature:dict)->str:
     """
     格式化天气预警信息
@@ -45,42 +327,115 @@ def format_alert(feature:dict)->str:
     """
 
 
+# ------------------------------
+# 预警的过滤、精简和分页：繁忙的州可能有几十条预警，全部格式化成文本会占用大量上下文
+# ------------------------------
+SEVERITY_RANK = {"Extreme": 4, "Severe": 3, "Moderate": 2, "Minor": 1, "Unknown": 0}
+MAX_ALERT_RESULTS = 50
+# 精简模式下区域描述的最大长度
+MAX_AREAS_LENGTH = 120
+
+
+def filter_alerts(features: list[dict], min_severity: str | None = None, event: str | None = None) -> list[dict]:
+    """
+    按严重程度和事件类型过滤预警，按严重程度从高到低排序
+    :param features: NWS返回的features
+    :param min_severity: 最低严重程度：Extreme | Severe | Moderate | Minor
+    :param event: 事件类型关键字（不区分大小写），例如 Flood、Heat
+    :return:
+    """
+    min_rank = SEVERITY_RANK.get((min_severity or "").capitalize(), 0)
+    event = (event or "").lower()
+    matched = [
+        feature for feature in features
+        if SEVERITY_RANK.get(feature["properties"].get("severity"), 0) >= min_rank
+        and event in (feature["properties"].get("event") or "").lower()
+    ]
+    return sorted(matched, key=lambda feature: -SEVERITY_RANK.get(feature["properties"].get("severity"), 0))
+
+
+def compact_alert(feature: dict) -> dict:
+    """只保留决策需要的字段，去掉很长的description和instruction"""
+    props = feature["properties"]
+    areas = props.get("areaDesc") or ""
+    return {
+        "event": props.get("event"),
+        "severity": props.get("severity"),
+        "urgency": props.get("urgency"),
+        "areas": areas if len(areas) <= MAX_AREAS_LENGTH else areas[:MAX_AREAS_LENGTH] + "...",
+        "headline": props.get("headline"),
+        "expires": props.get("expires"),
+    }
+
+
 @mcp.tool()
-async def get_alerts(state:str)-> str:
+async def get_alerts(state:str, min_severity: str | None = None, event: str | None = None, max_results: int = 10,
+                     offset: int = 0, compact: bool = False)-> str | dict:
     """
-    获取指定州的天气预警信息
+    获取指定州的天气预警信息，按严重程度从高到低排序并分页返回
     :param state: 州的缩写，例如CA, TX
-    :return:
+    :param min_severity: 只返回不低于该严重程度的预警：Extreme | Severe | Moderate | Minor
+    :param event: 只返回事件类型包含该关键字的预警，例如 Flood、Heat
+    :param max_results: 每页最多返回的预警数（最多50）
+    :param offset: 分页偏移，使用上一页返回的next_offset获取下一页
+    :param compact: True返回精简的结构化结果（预警很多时推荐），False返回包含完整描述的文本
+    :return: 上游请求失败时，文本返回"Unable to fetch alerts."，结构化结果中包含error字段
     """
     url = f"{BASER_URL}/alerts/active/area/{state}"
     data = await make_nws_request(url)
-    if not data or "features" not in data:
-        return "No alerts found."
+    if data is None:
+        # 与"没有预警"区分开，不能把上游故障当成没有预警
+        return {"state": state, "error": "Unable to fetch alerts."} if compact else "Unable to fetch alerts."
+    if "features" not in data:
+        return {"state": state, "total": 0, "offset": 0, "next_offset": None, "alerts": []} if compact \
+            else "No alerts found."
+
+    matched = filter_alerts(data["features"], min_severity, event)
+    max_results = max(1, min(max_results, MAX_ALERT_RESULTS))
+    offset = max(0, offset)
+    page = matched[offset:offset + max_results]
+    next_offset = offset + len(page) if offset + len(page) < len(matched) else None
+    if compact:
+        return {"state": state, "total": len(matched), "offset": offset, "next_offset": next_offset,
+                "alerts": [compact_alert(feature) for feature in page]}
 
-    if not data["features"]:
+    if not page:
         return "No alerts found."
-    alerts = [format_alert(feature) for feature in data["features"]]
+    alerts = [format_alert(feature) for feature in page]
+    if next_offset is not None:
+        alerts.append(f"Showing {offset + 1}-{next_offset} of {len(matched)} alerts, next_offset={next_offset}")
     return "\n".join(alerts)
 
 
-@mcp.tool()
-async def get_forecast(latitude: float, longitude: float) -> str:
-    """Get weather forecast for a location.
-
-    Args:        latitude: Latitude of the location        longitude: Longitude of the location    """
-    points_url = f"{BASER_URL}/points/{latitude},{longitude}"
-    points_data = await make_nws_request(points_url)
+async def fetch_forecast_periods(latitude: float, longitude: float) -> tuple[list[dict] | None, str | None]:
+    """
+    查询坐标的预报时段
+    :return: (预报时段列表, 错误信息)
+    """
+    # 相近的坐标共用同一个points缓存
+    points_url = f"{BASER_URL}/points/{round(latitude, POINTS_PRECISION)},{round(longitude, POINTS_PRECISION)}"
+    points_data = await make_nws_request(points_url, ttl=POINTS_TTL)
 
     if not points_data:
-        return "Unable to fetch forecast data for this location."
+        return None, "Unable to fetch forecast data for this location."
 
     forecast_url = points_data["properties"]["forecast"]
     forecast_data = await make_nws_request(forecast_url)
 
     if not forecast_data:
-        return "Unable to fetch detailed forecast."
+        return None, "Unable to fetch detailed forecast."
+    return forecast_data["properties"]["periods"], None
+
+
+@mcp.tool()
+async def get_forecast(latitude: float, longitude: float) -> str:
+    """Get weather forecast for a location.
+
+    Args:        latitude: Latitude of the location        longitude: Longitude of the location    """
+    periods, error = await fetch_forecast_periods(latitude, longitude)
+    if error:
+        return error
 
-    periods = forecast_data["properties"]["periods"]
     forecasts = []
     for period in periods[:5]:
         forecast = f"""  
@@ -94,5 +449,81 @@ async def get_forecast(latitude: float, longitude: float) -> str:
     return "\n---\n".join(forecasts)
 
 
+# ------------------------------
+# 批量工具：一次工具调用查询多个地点/州，并发请求，返回精简的结构化结果
+# ------------------------------
+MAX_BATCH_SIZE = 50
+
+
+def _compact_period(period: dict) -> dict:
+    return {
+        "name": period.get("name"),
+        "temperature": f"{period.get('temperature')}°{period.get('temperatureUnit', '')}",
+        "wind": f"{period.get('windSpeed', '')} {period.get('windDirection', '')}".strip(),
+        "forecast": period.get("shortForecast") or period.get("detailedForecast"),
+    }
+
+
+@mcp.tool()
+async def get_forecasts(locations: list[dict], periods: int = 2) -> list[dict]:
+    """
+    批量获取多个地点的天气预报，查询多个地点时优先使用这个工具
+    :param locations: 地点列表，例如[{"name": "Seattle", "latitude": 47.6, "longitude": -122.3}]，name可选
+    :param periods: 每个地点返回的预报时段数
+    :return: 与locations顺序一致的结果，失败的地点包含error
+    """
+    if len(locations) > MAX_BATCH_SIZE:
+        return [{"error": f"最多支持{MAX_BATCH_SIZE}个地点"}]
+
+    async def _one(location: dict) -> dict:
+        result = {"name": location.get("name"), "latitude": location.get("latitude"),
+                  "longitude": location.get("longitude")}
+        try:
+            forecast_periods, error = await fetch_forecast_periods(float(location["latitude"]),
+                                                                   float(location["longitude"]))
+        except (KeyError, TypeError, ValueError) as e:
+            return {**result, "error": f"invalid location: {e}"}
+        if error:
+            return {**result, "error": error}
+        return {**result, "periods": [_compact_period(period) for period in forecast_periods[:periods]]}
+
+    return list(await asyncio.gather(*(_one(location) for location in locations)))
+
+
+@mcp.tool()
+async def get_alerts_many(states: list[str], min_severity: str | None = None, event: str | None = None,
+                          max_results: int = 5) -> list[dict]:
+    """
+    批量获取多个州的天气预警
+    :param states: 州的缩写列表，例如["CA", "TX"]
+    :param min_severity: 只返回不低于该严重程度的预警：Extreme | Severe | Moderate | Minor
+    :param event: 只返回事件类型包含该关键字的预警
+    :param max_results: 每个州最多返回的预警数（按严重程度从高到低），更多的预警用get_alerts分页获取
+    :return: 与states顺序一致的结果：{"state", "count", "alerts": [{"event", "severity", "urgency", "areas", "headline", "expires"}]}
+    """
+    if len(states) > MAX_BATCH_SIZE:
+        return [{"error": f"最多支持{MAX_BATCH_SIZE}个州"}]
+    max_results = max(1, min(max_results, MAX_ALERT_RESULTS))
+
+    async def _one(state: str) -> dict:
+        data = await make_nws_request(f"{BASER_URL}/alerts/active/area/{state}")
+        if data is None:
+            return {"state": state, "error": "Unable to fetch alerts."}
+        matched = filter_alerts(data.get("features", []), min_severity, event)
+        return {"state": state, "count": len(matched),
+                "alerts": [compact_alert(feature) for feature in matched[:max_results]]}
+
+    return list(await asyncio.gather(*(_one(state) for state in states)))
+
+
+async def serve():
+    """运行streamable-http服务，停止时关闭共享的HTTP客户端"""
+    try:
+        await mcp.run_streamable_http_async()
+    finally:
+        await close_http_client()
+        nws_cache.save()
+
+
 if __name__ == '__main__':
-    mcp.run(transport="streamable-http")
\ No newline at end of file
+    asyncio.run(serve())
\ No newline at end of file
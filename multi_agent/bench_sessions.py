@@ -0,0 +1,80 @@
+"""
+对比director图同步和异步两种执行方式每秒能完成的会话数
+使用FakeChatModel替换真实模型，不访问网络，运行方式：
+
+python -m multi_agent.bench_sessions --sessions 500 --concurrency 200 --latency 0.05
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+from multi_agent import director
+from multi_agent.fake_llm import FakeChatModel
+
+
+def _session_input():
+    return {"messages": [HumanMessage(content="给我讲一个笑话")]}
+
+
+def _session_config():
+    return {"configurable": {"thread_id": str(uuid.uuid4())}}
+
+
+def run_sync(sessions: int, concurrency: int) -> float:
+    """
+    同步方式：线程池中执行graph.invoke，每个会话占用一个线程
+    :return: 每秒完成的会话数
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(director.graph.invoke, _session_input(), _session_config()) for _ in range(sessions)]
+        for future in futures:
+            future.result()
+    return sessions / (time.perf_counter() - start)
+
+
+async def run_async(sessions: int, concurrency: int) -> float:
+    """
+    异步方式：单个事件循环中并发执行graph.ainvoke
+    :return: 每秒完成的会话数
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _one():
+        async with semaphore:
+            await director.graph.ainvoke(_session_input(), _session_config())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_one() for _ in range(sessions)))
+    return sessions / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="假模型每次调用的延迟（秒）")
+    args = parser.parse_args()
+
+    director.llm = FakeChatModel(latency=args.latency)
+    # 节点里有大量print，压测时丢弃
+    with contextlib.redirect_stdout(io.StringIO()):
+        sync_rate = run_sync(args.sessions, args.concurrency)
+        async_rate = asyncio.run(run_async(args.sessions, args.concurrency))
+
+    print(f"sessions={args.sessions} concurrency={args.concurrency} latency={args.latency}s")
+    print(f"sync  (graph.invoke + 线程池): {sync_rate:8.1f} sessions/s")
+    print(f"async (graph.ainvoke)        : {async_rate:8.1f} sessions/s")
+
+
+if __name__ == '__main__':
+    main()
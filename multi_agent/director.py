@@ -1,23 +1,31 @@
+import asyncio
+import json
 import operator
 import os
+import time
 import uuid
-from typing import TypedDict, Annotated, List
+from typing import TypedDict, Annotated, List, NotRequired
 
 from dotenv import load_dotenv
 from langchain.chat_models import init_chat_model
-from langchain_core.messages import AnyMessage, HumanMessage
-from langchain_core.runnables import RunnableConfig
-from langchain_mcp_adapters.client import MultiServerMCPClient
-from langgraph.checkpoint.memory import InMemorySaver
+from langchain_core.messages import AIMessage, AIMessageChunk, AnyMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.config import get_stream_writer
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
-from langgraph.prebuilt import create_react_agent
+
+from langgraph_checkpoint.bounded_saver import BoundedInMemorySaver
+from multi_agent.intent_classifier import FastPathClassifier, KeywordClassifier, NgramLogisticClassifier
+from multi_agent.speculation import BufferedWriter, SpecialistFunc, SpeculationPrior, SpeculationStats, TimedTask
+from multi_agent.stream_metrics import LatencyHook, LatencyStats, NodeTimer
+from multi_agent.weather_agent import WeatherAgentCache, run_in_background_loop
 
 load_dotenv()
 class State(TypedDict):
     messages:Annotated[List[AnyMessage], operator.add]
     type:str
+    # 推测执行命中时为hit，此时专家节点的结果已经在supervisor中写入，直接结束
+    speculation: NotRequired[str | None]
 
 
 llm = init_chat_model(
@@ -30,12 +38,12 @@ llm = init_chat_model(
 
 node_types = ["supervisor", "weather", "joke", "couplet", "other"]
 
-def supervisor_node(state: State):
-    print(">>> supervisor node <<<")
-    writer=get_stream_writer()
-    writer({"node": "supervisor node"})
-    ### 根据用户的问题对问题进行分类，分类结果保存在state的type字段
-    prompt = """你是一个专业的客服助手，负责对用户的问题进行分类，并将任务分给其他Agent执行。
+# 节点耗时hook：每个流式节点结束时调用hook(节点, 首token耗时, 总耗时)，默认汇总到latency_stats
+latency_stats = LatencyStats()
+node_latency_hooks: list[LatencyHook] = [latency_stats]
+
+### 根据用户的问题对问题进行分类，分类结果保存在state的type字段
+supervisor_prompt = """你是一个专业的客服助手，负责对用户的问题进行分类，并将任务分给其他Agent执行。
     如果用户的问题与天气相关，返回weather
     如果用户的问题是希望讲一个笑话，返回joke
     如果用户的问题是希望对对联，返回couplet
@@ -43,17 +51,27 @@ def supervisor_node(state: State):
     除了以上选项，不要返回其他任何内容
     """
 
-    # 如果type已经存在，则返回
-    if state.get("type"):
-        writer({"node": "supervisor node", "message": f"已经处理过了，type: {state.get('type')}"})
-        return {"type": END}
 
-    message = [
-        {"role": "system", "content": prompt},
+def _supervisor_messages(state: State):
+    return [
+        {"role": "system", "content": supervisor_prompt},
         {"role": "user", "content": state.get("messages")[-1].content}
     ]
-    ai_response = llm.invoke(message)
 
+
+# 本地快速分类：关键词规则 + 可选的逻辑回归模型（INTENT_MODEL_PATH），置信度不够时才调用大模型
+_intent_classifiers = [KeywordClassifier()]
+if os.getenv("INTENT_MODEL_PATH") and os.path.exists(os.getenv("INTENT_MODEL_PATH")):
+    _intent_classifiers.append(NgramLogisticClassifier.load(os.getenv("INTENT_MODEL_PATH")))
+intent_classifier = FastPathClassifier(
+    _intent_classifiers,
+    labels=node_types,
+    threshold=float(os.getenv("INTENT_THRESHOLD", "0.9")),
+    label_log_path=os.getenv("INTENT_LABEL_LOG"),
+)
+
+
+def _supervisor_result(writer, ai_response):
     if ai_response.content not in node_types:
         writer({"node": "supervisor node", "message": f"无法识别的type: {ai_response.content}"})
         raise ValueError(f"模型无法识别的type: {ai_response.content}, 必须在以下选项中选择：{'/'.join(node_types)}")
@@ -61,36 +79,161 @@ def supervisor_node(state: State):
     return {
         "messages": [ai_response],
         "type": ai_response.content,
+        "speculation": None,
     }
 
 
+def supervisor_node(state: State):
+    print(">>> supervisor node <<<")
+    writer=get_stream_writer()
+    writer({"node": "supervisor node"})
+
+    # 如果type已经存在，则返回
+    if state.get("type"):
+        writer({"node": "supervisor node", "message": f"已经处理过了，type: {state.get('type')}"})
+        return {"type": END}
+
+    text = state.get("messages")[-1].content
+    label = intent_classifier.classify(text)
+    if label is not None:
+        writer({"node": "supervisor node", "message": f"本地分类命中：{label}"})
+        return _supervisor_result(writer, AIMessage(content=label))
+
+    start = time.perf_counter()
+    ai_response = llm.invoke(_supervisor_messages(state))
+    intent_classifier.record_llm(text, ai_response.content, time.perf_counter() - start)
+    return _supervisor_result(writer, ai_response)
+
+
+async def asupervisor_node(state: State):
+    print(">>> supervisor node <<<")
+    writer=get_stream_writer()
+    writer({"node": "supervisor node"})
+
+    if state.get("type"):
+        writer({"node": "supervisor node", "message": f"已经处理过了，type: {state.get('type')}"})
+        return {"type": END}
+
+    text = state.get("messages")[-1].content
+    label = intent_classifier.classify(text)
+    if label is not None:
+        writer({"node": "supervisor node", "message": f"本地分类命中：{label}"})
+        return _supervisor_result(writer, AIMessage(content=label))
+
+    guess = speculation_prior.guess(text) if speculation_enabled else None
+    if guess in speculative_specialists:
+        return await _speculative_supervisor(state, writer, text, guess)
+
+    start = time.perf_counter()
+    ai_response = await llm.ainvoke(_supervisor_messages(state))
+    intent_classifier.record_llm(text, ai_response.content, time.perf_counter() - start)
+    speculation_prior.observe(ai_response.content)
+    return _supervisor_result(writer, ai_response)
+
+
+### 推测执行（只在graph.ainvoke/astream中生效）：分类的同时执行最可能的专家节点，猜对了省掉一次大模型延迟
+speculation_enabled = os.getenv("SPECULATIVE_SPECIALIST") == "1"
+speculation_prior = SpeculationPrior(intent_classifier.classifiers)
+speculation_stats = SpeculationStats()
+
+
+async def _speculative_supervisor(state: State, writer, text: str, guess: str):
+    """
+    分类和猜测的专家节点并行执行，专家节点的custom流事件先缓存，猜对了才输出
+    :param state:
+    :param writer:
+    :param text: 用户问题
+    :param guess: 猜测的分类
+    :return:
+    """
+    buffer = BufferedWriter()
+    # 专家节点看到的state和正常流程一致：末尾是supervisor的分类结果
+    speculative_state = {"messages": state.get("messages") + [AIMessage(content=guess)], "type": guess}
+    specialist = TimedTask(speculative_specialists[guess](speculative_state, buffer))
+    start = time.perf_counter()
+    try:
+        ai_response = await llm.ainvoke(_supervisor_messages(state))
+    except BaseException:
+        await specialist.cancel()
+        raise
+    classify_seconds = time.perf_counter() - start
+    intent_classifier.record_llm(text, ai_response.content, classify_seconds)
+    speculation_prior.observe(ai_response.content)
+
+    if ai_response.content != guess:
+        speculation_stats.record(False, classify_seconds, await specialist.cancel())
+        writer({"node": "supervisor node", "message": f"推测执行未命中：{guess}"})
+        return _supervisor_result(writer, ai_response)
+
+    result = _supervisor_result(writer, ai_response)
+    specialist_result = await specialist.result()
+    speculation_stats.record(True, classify_seconds, specialist.elapsed)
+    writer({"node": "supervisor node", "message": f"推测执行命中：{guess}"})
+    buffer.flush(writer)
+    return {
+        "messages": result["messages"] + specialist_result["messages"],
+        "type": specialist_result["type"],
+        "speculation": "hit",
+    }
+
+
+weather_connections = {
+    "weather": {
+        "url": "https://dashscope.aliyuncs.com/api/v1/mcps/zuimei-getweather/sse",
+        "transport": "sse",
+        "headers": {"Authorization": f"Bearer {os.getenv('DASHSCOPE_API_KEY')}"}
+    }
+}
+
+# 天气MCP客户端和天气agent只创建一次，之后每次调用只需要执行工具
+weather_agent_cache = WeatherAgentCache(model=llm, connections=weather_connections)
+
+
+def warmup_weather_agent():
+    """服务启动时预热：提前建立MCP连接并编译天气agent"""
+    weather_agent_cache.warmup()
+
+
+async def _weather(state: State, writer):
+    timer = NodeTimer("weather node", node_latency_hooks)
+    messages = [{"role": "user", "content": state.get("messages")[0].content}]
+    final_result = None
+    # messages模式逐token转发agent的回复，values模式拿到最终状态
+    async for mode, chunk in weather_agent_cache.astream(messages, stream_mode=["messages", "values"]):
+        if mode == "messages":
+            message_chunk, _ = chunk
+            if isinstance(message_chunk, AIMessageChunk) and message_chunk.content:
+                timer.token()
+                writer({"node": "weather node", "token": message_chunk.content})
+            continue
+        print(">>> weather agent chunk >>>")
+        final_result = chunk
+        print(chunk)
+    timer.finish()
+    return {"messages": [final_result.get("messages")[-1]], "type": state.get("type")}
+
+
 def weather_node(state: State):
-    import asyncio
-    async def _weather():
-        writer = get_stream_writer()
-        writer({"node": "weather node"})
-        mcp_client = MultiServerMCPClient({
-            "weather": {
-                "url": "https://dashscope.aliyuncs.com/api/v1/mcps/zuimei-getweather/sse",
-                "transport": "sse",
-                "headers": {"Authorization": f"Bearer {os.getenv('DASHSCOPE_API_KEY')}"}
-            }
-        })
-        mcp_tools = await mcp_client.get_tools()
-        agent = create_react_agent(
-            model=llm,
-            tools=mcp_tools,
-            prompt="你是一个专业的天气预报专家，请根据用户问题给出天气预报。",
-        )
-        messages = [{"role": "user", "content": state.get("messages")[0].content}]
-        final_result = None
-        async for chunk in agent.astream({"messages": messages}):
-            print(">>> weather agent chunk >>>")
-            final_result = chunk
-            print(chunk)
-        return {"messages": [final_result.get("messages")], "type": state.get("type")}
-
-    return asyncio.run(_weather())
+    print(">>> weather node <<<")
+    writer = get_stream_writer()
+    writer({"node": "weather node"})
+    # 长连接绑定在后台事件循环上，不能每次asyncio.run新建事件循环
+    return run_in_background_loop(_weather(state, writer))
+
+
+async def aweather_node(state: State):
+    print(">>> weather node <<<")
+    writer = get_stream_writer()
+    writer({"node": "weather node"})
+    # 异步执行时直接复用当前事件循环上的长连接
+    return await _weather(state, writer)
+
+
+def _joke_messages(state: State):
+    return [
+        {"role": "system", "content": "你是一个讲笑话的大师，可以根据用户问题讲一个笑话"},
+        {"role": "user", "content": state.get("messages")[-1].content}
+    ]
 
 
 def joke_node(state: State):
@@ -98,18 +241,51 @@ def joke_node(state: State):
     writer=get_stream_writer()
     writer({"node": "joke node"})
 
-    messages = [
-        {"role": "system", "content": "你是一个讲笑话的大师，可以根据用户问题讲一个笑话"},
-        {"role": "user", "content": state.get("messages")[-1].content}
-    ]
+    # 逐个chunk转发给custom流，最后再输出完整内容
+    timer = NodeTimer("joke node", node_latency_hooks)
+    ai_response = None
+    for chunk in llm.stream(_joke_messages(state)):
+        if chunk.content:
+            timer.token()
+            writer({"node": "joke node", "token": chunk.content})
+        ai_response = chunk if ai_response is None else ai_response + chunk
+    timer.finish()
+    writer({"node": "joke node", "message": ai_response.content})
+    return {
+        "messages": [AIMessage(content=ai_response.content, id=ai_response.id)],
+        "type": state.get("type")
+    }
+
 
-    ai_response = llm.invoke(messages)
+async def _ajoke(state: State, writer):
+    timer = NodeTimer("joke node", node_latency_hooks)
+    ai_response = None
+    async for chunk in llm.astream(_joke_messages(state)):
+        if chunk.content:
+            timer.token()
+            writer({"node": "joke node", "token": chunk.content})
+        ai_response = chunk if ai_response is None else ai_response + chunk
+    timer.finish()
     writer({"node": "joke node", "message": ai_response.content})
     return {
-        "messages": [ai_response],
+        "messages": [AIMessage(content=ai_response.content, id=ai_response.id)],
         "type": state.get("type")
     }
 
+
+async def ajoke_node(state: State):
+    print(">>> joke node <<<")
+    writer=get_stream_writer()
+    writer({"node": "joke node"})
+    return await _ajoke(state, writer)
+
+
+# 可以推测执行的专家节点：只有调用大模型的节点才值得推测执行
+speculative_specialists: dict[str, SpecialistFunc] = {
+    "weather": _weather,
+    "joke": _ajoke,
+}
+
 def couplet_node(state: State):
     print(">>> couplet node <<<")
     writer=get_stream_writer()
@@ -128,31 +304,173 @@ def other_node(state: State):
         "type": "other"
     }
 
-def routing_func(state: State):
-    print(">>> routing func <<<")
-    writer=get_stream_writer()
-    writer({"node": "routing func"})
-    if "type" in state and state["type"] == "weather":
+# 这两个节点没有IO，异步版本直接复用同步实现，避免在线程池中执行
+async def acouplet_node(state: State):
+    return couplet_node(state)
+
+
+async def aother_node(state: State):
+    return other_node(state)
+
+def route_for_type(type: str | None) -> str:
+    if type == "weather":
         return "weather_node"
-    elif "type" in state and state["type"] == "joke":
+    elif type == "joke":
         return "joke_node"
-    elif "type" in state and state["type"] == "couplet":
+    elif type == "couplet":
         return "couplet_node"
     return "other_node"
 
+
+def routing_func(state: State):
+    print(">>> routing func <<<")
+    writer=get_stream_writer()
+    writer({"node": "routing func"})
+    if state.get("speculation") == "hit":
+        return END
+    return route_for_type(state.get("type"))
+
+
+### 批量分类：一次突发的多条用户消息合并到一个分类prompt里，减少大模型调用次数
+supervisor_batch_prompt = supervisor_prompt + """现在会一次给你多个带编号的用户问题，请逐个分类。
+    只返回一个JSON数组，第i个元素是第i个问题的分类，例如["weather", "joke", "other"]
+    """
+
+
+def _batch_messages(texts: list[str]):
+    numbered = "\n".join(f"{i + 1}. {text}" for i, text in enumerate(texts))
+    return [
+        {"role": "system", "content": supervisor_batch_prompt},
+        {"role": "user", "content": numbered}
+    ]
+
+
+def _parse_batch_labels(content: str, size: int) -> list[str] | None:
+    """
+    解析批量分类结果，格式不对时返回None，由调用方逐条重新分类
+    :param content: 模型返回的内容
+    :param size: 期望的分类个数
+    :return:
+    """
+    content = content.strip().removeprefix("```json").removeprefix("```").removesuffix("```").strip()
+    try:
+        labels = json.loads(content)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(labels, list) or len(labels) != size:
+        return None
+    return [str(label).strip() for label in labels]
+
+
+# 单条重新分类后仍然无法识别的消息使用的分类
+batch_fallback_type = "other"
+
+
+def _single_messages(text: str):
+    return [{"role": "system", "content": supervisor_prompt}, {"role": "user", "content": text}]
+
+
+def _invalid_indexes(labels: list[str | None]) -> list[int]:
+    return [k for k, label in enumerate(labels) if label not in node_types]
+
+
+def _single_labels(responses: list) -> list[str | None]:
+    """llm.batch(return_exceptions=True)的结果，调用失败的记为None"""
+    return [None if isinstance(response, Exception) else response.content for response in responses]
+
+
+def _batch_result(texts: list[str], labels: list[str | None]) -> list[dict]:
+    """单条重新分类后仍然无法识别的消息按batch_fallback_type处理，不影响同一批的其他消息"""
+    results = []
+    for text, label in zip(texts, labels):
+        if label not in node_types:
+            results.append({"text": text, "type": batch_fallback_type, "route": route_for_type(batch_fallback_type),
+                            "fallback": True})
+            continue
+        results.append({"text": text, "type": label, "route": route_for_type(label)})
+    return results
+
+
+def classify_batch(texts: list[str], batch_size: int = 20) -> list[dict]:
+    """
+    批量分类，每batch_size条消息只调用一次大模型，本地分类命中的消息不进入prompt。
+    整批结果无法解析、或者个别分类无法识别时，只对这些消息逐条重新分类，仍然无法识别的按batch_fallback_type处理
+    :param texts: 用户消息
+    :param batch_size: 每个prompt最多包含的消息数
+    :return: 每条消息的{"text", "type", "route"}，route与routing_func的返回值一致；使用了兜底分类时包含"fallback": True
+    """
+    labels = [intent_classifier.classify(text) for text in texts]
+    pending = [i for i, label in enumerate(labels) if label is None]
+    for offset in range(0, len(pending), batch_size):
+        indexes = pending[offset:offset + batch_size]
+        chunk = [texts[i] for i in indexes]
+        start = time.perf_counter()
+        ai_response = llm.invoke(_batch_messages(chunk))
+        chunk_labels = _parse_batch_labels(ai_response.content, len(chunk)) or [None] * len(chunk)
+        retry = _invalid_indexes(chunk_labels)
+        if retry:
+            responses = llm.batch([_single_messages(chunk[k]) for k in retry], return_exceptions=True)
+            for k, label in zip(retry, _single_labels(responses)):
+                chunk_labels[k] = label
+        elapsed = (time.perf_counter() - start) / len(chunk)
+        for i, label in zip(indexes, chunk_labels):
+            labels[i] = label
+            if label in node_types:
+                intent_classifier.record_llm(texts[i], label, elapsed)
+    return _batch_result(texts, labels)
+
+
+async def aclassify_batch(texts: list[str], batch_size: int = 20, max_concurrency: int = 4) -> list[dict]:
+    """
+    classify_batch的异步版本，多个prompt之间最多max_concurrency个并发
+    :param texts:
+    :param batch_size:
+    :param max_concurrency:
+    :return:
+    """
+    labels = [intent_classifier.classify(text) for text in texts]
+    pending = [i for i, label in enumerate(labels) if label is None]
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _classify_chunk(indexes: list[int]):
+        chunk = [texts[i] for i in indexes]
+        async with semaphore:
+            start = time.perf_counter()
+            ai_response = await llm.ainvoke(_batch_messages(chunk))
+            chunk_labels = _parse_batch_labels(ai_response.content, len(chunk)) or [None] * len(chunk)
+            retry = _invalid_indexes(chunk_labels)
+            if retry:
+                responses = await llm.abatch([_single_messages(chunk[k]) for k in retry],
+                                             config={"max_concurrency": max_concurrency}, return_exceptions=True)
+                for k, label in zip(retry, _single_labels(responses)):
+                    chunk_labels[k] = label
+            elapsed = (time.perf_counter() - start) / len(chunk)
+        for i, label in zip(indexes, chunk_labels):
+            labels[i] = label
+            if label in node_types:
+                intent_classifier.record_llm(texts[i], label, elapsed)
+
+    await asyncio.gather(*(_classify_chunk(pending[offset:offset + batch_size])
+                           for offset in range(0, len(pending), batch_size)))
+    return _batch_result(texts, labels)
+
+
 builder = StateGraph(State)
-builder.add_node("supervisor_node", supervisor_node)
-builder.add_node("weather_node", weather_node)
-builder.add_node("joke_node", joke_node)
-builder.add_node("couplet_node", couplet_node)
-builder.add_node("other_node", other_node)
+# 同时注册同步和异步实现：graph.stream/invoke走同步函数，graph.astream/ainvoke走异步函数，
+# 异步模式下所有会话共用一个事件循环
+builder.add_node("supervisor_node", RunnableLambda(supervisor_node, afunc=asupervisor_node))
+builder.add_node("weather_node", RunnableLambda(weather_node, afunc=aweather_node))
+builder.add_node("joke_node", RunnableLambda(joke_node, afunc=ajoke_node))
+builder.add_node("couplet_node", RunnableLambda(couplet_node, afunc=acouplet_node))
+builder.add_node("other_node", RunnableLambda(other_node, afunc=aother_node))
 
 # 添加边
 builder.add_edge(START, "supervisor_node")
 builder.add_conditional_edges("supervisor_node", routing_func,
                               ["weather_node", "joke_node", "couplet_node", "other_node", END])
 
-checkpointer = InMemorySaver()
+# 每个请求一个线程，长时间运行时按LRU/TTL淘汰线程，每个线程只保留最近的checkpoint
+checkpointer = BoundedInMemorySaver(max_threads=10000, ttl=3600, max_bytes=256 * 1024 * 1024, keep_last=5)
 config:RunnableConfig = {
     "configurable": {
         "thread_id": uuid.uuid4()
@@ -162,6 +480,7 @@ graph = builder.compile(checkpointer=checkpointer)
 
 
 if __name__ == '__main__':
+    warmup_weather_agent()
     for chunk in graph.stream(input=State(messages=[HumanMessage(content="帮我查一下深圳的天气")]),
                               config=config, stream_mode="custom"):
 
@@ -0,0 +1,146 @@
+"""
+用于压测的假模型：不访问任何模型接口，按可配置的延迟分布返回预设内容，随机数由seed决定，结果可复现
+"""
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Any, Callable, Iterator, AsyncIterator
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+
+def default_responder(messages: list[BaseMessage]) -> str:
+    """
+    默认回复：分类请求返回joke，其他请求返回一个固定的笑话
+    :param messages:
+    :return:
+    """
+    if _is_classify_request(messages):
+        if "JSON数组" in str(messages[0].content):
+            # 批量分类：每行一个带编号的问题
+            return json.dumps(["joke"] * len(str(messages[-1].content).splitlines()))
+        return "joke"
+    return "从前有个程序员，他写的代码从来不出bug，因为他从来不写代码。"
+
+
+def _is_classify_request(messages: list[BaseMessage]) -> bool:
+    return bool(messages) and "负责对用户的问题进行分类" in str(messages[0].content)
+
+
+class LabelResponder:
+    """按权重随机返回分类结果的responder，用于模拟supervisor的分类分布"""
+
+    def __init__(self, label_weights: dict[str, float], text: str | None = None, seed: int = 0):
+        self.labels = list(label_weights)
+        self.weights = list(label_weights.values())
+        self.text = text
+        self._rng = random.Random(seed)
+
+    def __call__(self, messages: list[BaseMessage]) -> str:
+        if not _is_classify_request(messages):
+            return self.text or default_responder(messages)
+        if "JSON数组" in str(messages[0].content):
+            size = len(str(messages[-1].content).splitlines())
+            return json.dumps(self._rng.choices(self.labels, self.weights, k=size))
+        return self._rng.choices(self.labels, self.weights)[0]
+
+
+class FakeChatModel(BaseChatModel):
+    """按配置的延迟返回responder生成内容的假模型，支持invoke/ainvoke/stream/astream和bind_tools"""
+
+    latency: float = 0.05
+    """每次调用的平均延迟（秒），流式输出时平均分摊到每个chunk上"""
+    chunk_size: int = 4
+    """流式输出时每个chunk包含的字符数"""
+    latency_jitter: float = 0.0
+    """延迟的标准差（秒），实际延迟按正态分布采样"""
+    seed: int = 0
+    responder: Callable[[list[BaseMessage]], str] = default_responder
+    tool_args: dict = {"city": "深圳"}
+    """绑定了工具时，第一次回复调用第一个工具使用的参数"""
+
+    _rng: random.Random = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _latency(self) -> float:
+        if not self.latency_jitter:
+            return self.latency
+        return max(0.0, self._rng.gauss(self.latency, self.latency_jitter))
+
+    def bind_tools(self, tools, **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _tool_call(self, messages: list[BaseMessage], tools: list[dict] | None) -> dict | None:
+        """
+        模拟react agent：绑定了工具并且还没有拿到工具结果时，调用第一个工具
+        :param messages:
+        :param tools: bind_tools传入的工具
+        :return:
+        """
+        if not tools or isinstance(messages[-1], ToolMessage):
+            return None
+        return {"name": tools[0]["function"]["name"], "args": dict(self.tool_args), "id": f"call_{uuid.uuid4().hex[:12]}"}
+
+    def _message(self, messages: list[BaseMessage], tools: list[dict] | None) -> AIMessage:
+        tool_call = self._tool_call(messages, tools)
+        if tool_call:
+            return AIMessage(content="", tool_calls=[tool_call])
+        return AIMessage(content=self.responder(messages))
+
+    def _chunks(self, text: str) -> list[str]:
+        return [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or [""]
+
+    @staticmethod
+    def _tool_call_chunk(tool_call: dict) -> AIMessageChunk:
+        return AIMessageChunk(content="", tool_call_chunks=[
+            {"name": tool_call["name"], "args": json.dumps(tool_call["args"], ensure_ascii=False),
+             "id": tool_call["id"], "index": 0}
+        ])
+
+    def _generate(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._latency())
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, kwargs.get("tools")))])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                         run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._latency())
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, kwargs.get("tools")))])
+
+    def _stream(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        latency = self._latency()
+        tool_call = self._tool_call(messages, kwargs.get("tools"))
+        if tool_call:
+            time.sleep(latency)
+            yield ChatGenerationChunk(message=self._tool_call_chunk(tool_call))
+            return
+        chunks = self._chunks(self.responder(messages))
+        for text in chunks:
+            time.sleep(latency / len(chunks))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
+
+    async def _astream(self, messages: list[BaseMessage], stop: list[str] | None = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        latency = self._latency()
+        tool_call = self._tool_call(messages, kwargs.get("tools"))
+        if tool_call:
+            await asyncio.sleep(latency)
+            yield ChatGenerationChunk(message=self._tool_call_chunk(tool_call))
+            return
+        chunks = self._chunks(self.responder(messages))
+        for text in chunks:
+            await asyncio.sleep(latency / len(chunks))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=text))
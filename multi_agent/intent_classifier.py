@@ -0,0 +1,217 @@
+"""
+supervisor的本地快速意图分类：
+1. 关键词规则和基于字符n-gram的NumPy逻辑回归模型，置信度足够高时直接返回分类结果，不调用大模型
+2. 置信度不够时回退到大模型分类，大模型的分类结果可以记录到日志中，用于训练逻辑回归模型
+3. 统计命中率和耗时，观察有多少请求跳过了大模型
+
+训练模型：
+python -m multi_agent.intent_classifier labels.jsonl intent_model.npz
+"""
+import json
+import threading
+import time
+import zlib
+from typing import Iterable
+
+import numpy as np
+
+
+class BaseIntentClassifier:
+    """意图分类器基类，classify返回(分类, 置信度)，无法判断时返回(None, 0.0)"""
+
+    def classify(self, text: str) -> tuple[str | None, float]:
+        raise NotImplementedError
+
+
+default_keyword_rules = {
+    "weather": ["天气", "气温", "温度", "下雨", "降雨", "下雪", "刮风", "台风", "预报", "weather", "forecast"],
+    "joke": ["笑话", "段子", "搞笑", "逗我", "joke"],
+    "couplet": ["对联", "上联", "下联", "春联", "couplet"],
+}
+
+
+class KeywordClassifier(BaseIntentClassifier):
+    """关键词规则分类：只命中一个分类时置信度最高，同时命中多个分类时按命中数分摊置信度"""
+
+    def __init__(self, rules: dict[str, list[str]] | None = None, hit_confidence: float = 0.95):
+        self.rules = {label: [keyword.lower() for keyword in keywords]
+                      for label, keywords in (rules or default_keyword_rules).items()}
+        self.hit_confidence = hit_confidence
+
+    def classify(self, text: str) -> tuple[str | None, float]:
+        text = text.lower()
+        scores = {label: sum(1 for keyword in keywords if keyword in text) for label, keywords in self.rules.items()}
+        total = sum(scores.values())
+        if total == 0:
+            return None, 0.0
+        label = max(scores, key=scores.get)
+        return label, self.hit_confidence * scores[label] / total
+
+
+class NgramLogisticClassifier(BaseIntentClassifier):
+    """字符n-gram哈希特征 + softmax逻辑回归，只依赖NumPy"""
+
+    def __init__(self, labels: list[str] | None = None, n_features: int = 1 << 14, ngram_range: tuple[int, int] = (1, 3)):
+        self.labels = list(labels or [])
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.weights = np.zeros((n_features, len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+
+    def _features(self, text: str) -> np.ndarray:
+        """
+        把文本转换成L2归一化的哈希n-gram向量
+        :param text:
+        :return:
+        """
+        vector = np.zeros(self.n_features, dtype=np.float32)
+        text = text.lower().strip()
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                vector[zlib.crc32(text[i:i + n].encode("utf-8")) % self.n_features] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def fit(self, texts: list[str], labels: list[str], epochs: int = 200, lr: float = 1.0, l2: float = 1e-4):
+        """
+        全量梯度下降训练
+        :param texts:
+        :param labels:
+        :param epochs:
+        :param lr: 学习率
+        :param l2: L2正则系数
+        :return:
+        """
+        self.labels = sorted(set(labels))
+        x = np.stack([self._features(text) for text in texts])
+        y = np.zeros((len(texts), len(self.labels)), dtype=np.float32)
+        y[np.arange(len(texts)), [self.labels.index(label) for label in labels]] = 1.0
+        self.weights = np.zeros((self.n_features, len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+        for _ in range(epochs):
+            grad = self._softmax(x @ self.weights + self.bias) - y
+            self.weights -= lr * (x.T @ grad / len(texts) + l2 * self.weights)
+            self.bias -= lr * grad.mean(axis=0)
+        return self
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    def classify(self, text: str) -> tuple[str | None, float]:
+        if not self.labels:
+            return None, 0.0
+        probs = self._softmax(self._features(text) @ self.weights + self.bias)
+        index = int(probs.argmax())
+        return self.labels[index], float(probs[index])
+
+    def save(self, path: str):
+        np.savez_compressed(path, weights=self.weights, bias=self.bias, labels=np.array(self.labels),
+                            n_features=self.n_features, ngram_range=np.array(self.ngram_range))
+
+    @classmethod
+    def load(cls, path: str) -> "NgramLogisticClassifier":
+        data = np.load(path)
+        model = cls(labels=[str(label) for label in data["labels"]], n_features=int(data["n_features"]),
+                    ngram_range=tuple(int(n) for n in data["ngram_range"]))
+        model.weights = data["weights"]
+        model.bias = data["bias"]
+        return model
+
+
+def load_labeled_log(path: str) -> tuple[list[str], list[str]]:
+    """
+    读取大模型分类日志，每行是{"text": ..., "label": ...}
+    :param path:
+    :return: (文本列表, 分类列表)
+    """
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                texts.append(record["text"])
+                labels.append(record["label"])
+    return texts, labels
+
+
+class FastPathClassifier:
+    """
+    依次尝试本地分类器，第一个置信度不低于阈值的结果直接返回；否则返回None，由调用方回退到大模型
+    """
+
+    def __init__(self, classifiers: Iterable[BaseIntentClassifier], labels: Iterable[str],
+                 threshold: float = 0.9, label_log_path: str | None = None):
+        self.classifiers = list(classifiers)
+        self.labels = set(labels)
+        self.threshold = threshold
+        self.label_log_path = label_log_path
+        self._lock = threading.Lock()
+        self.total = 0
+        self.fast_hits = 0
+        self.llm_fallbacks = 0
+        self.hits_by_label: dict[str, int] = {}
+        self.local_latency = 0.0
+        self.llm_latency = 0.0
+
+    def classify(self, text: str) -> str | None:
+        """
+        :param text: 用户问题
+        :return: 高置信度的分类，没有则返回None
+        """
+        start = time.perf_counter()
+        result = None
+        for classifier in self.classifiers:
+            label, confidence = classifier.classify(text)
+            if label in self.labels and confidence >= self.threshold:
+                result = label
+                break
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.total += 1
+            self.local_latency += elapsed
+            if result is not None:
+                self.fast_hits += 1
+                self.hits_by_label[result] = self.hits_by_label.get(result, 0) + 1
+        return result
+
+    def record_llm(self, text: str, label: str, latency: float):
+        """
+        记录一次大模型分类：耗时计入统计，合法的分类结果写入日志供后续训练
+        :param text:
+        :param label:
+        :param latency:
+        :return:
+        """
+        with self._lock:
+            self.llm_fallbacks += 1
+            self.llm_latency += latency
+            if self.label_log_path and label in self.labels:
+                with open(self.label_log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"text": text, "label": label}, ensure_ascii=False) + "\n")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "total": self.total,
+                "fast_hits": self.fast_hits,
+                "llm_fallbacks": self.llm_fallbacks,
+                "hit_rate": self.fast_hits / self.total if self.total else 0.0,
+                "hits_by_label": dict(self.hits_by_label),
+                "avg_local_latency_ms": self.local_latency / self.total * 1000 if self.total else 0.0,
+                "avg_llm_latency_ms": self.llm_latency / self.llm_fallbacks * 1000 if self.llm_fallbacks else 0.0,
+            }
+
+
+if __name__ == '__main__':
+    import sys
+
+    log_path, model_path = sys.argv[1], sys.argv[2]
+    train_texts, train_labels = load_labeled_log(log_path)
+    classifier = NgramLogisticClassifier().fit(train_texts, train_labels)
+    classifier.save(model_path)
+    correct = sum(classifier.classify(text)[0] == label for text, label in zip(train_texts, train_labels))
+    print(f"训练样本数：{len(train_texts)}，训练集准确率：{correct / len(train_texts):.2%}，模型已保存到 {model_path}")
@@ -0,0 +1,205 @@
+"""
+director图的压测工具：
+1. 用FakeChatModel替换llm（可配置延迟分布和分类分布），用本地桩服务替换天气MCP，不访问任何外部服务
+2. 并发执行大量会话，统计吞吐、端到端和每个节点的p50/p95/p99耗时
+3. 统计checkpointer在压测前后的内存增长，可选用tracemalloc统计进程内存
+
+python -m multi_agent.loadtest --conversations 2000 --concurrency 200 --llm-latency 0.05 --llm-jitter 0.02
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import random
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.messages import HumanMessage
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+from langgraph_mcp.tool_metrics import tool_metrics
+from multi_agent import director
+from multi_agent.fake_llm import FakeChatModel, LabelResponder
+from multi_agent.stream_metrics import percentile
+from multi_agent.stub_weather_server import start_stub_weather_server
+
+# 这些问题不会命中本地关键词分类，分类结果由假模型的分类分布决定
+default_questions = ["你好呀", "今天有什么新鲜事", "帮我看看这个问题", "随便聊聊吧", "深圳明天怎么样"]
+
+
+def checkpointer_size(saver) -> dict:
+    """
+    统计InMemorySaver（及其子类）中的线程数、checkpoint数和序列化后的字节数
+    :param saver:
+    :return:
+    """
+    checkpoints = 0
+    size = 0
+    for namespaces in saver.storage.values():
+        for checkpoints_by_id in namespaces.values():
+            checkpoints += len(checkpoints_by_id)
+            for checkpoint, metadata, _ in checkpoints_by_id.values():
+                size += len(checkpoint[1]) + len(metadata[1])
+    for writes in saver.writes.values():
+        for _, _, value, _ in writes.values():
+            size += len(value[1])
+    for _, value in saver.blobs.items():
+        size += len(value[1])
+    return {"threads": len(saver.storage), "checkpoints": checkpoints, "bytes": size}
+
+
+class NodeRecorder:
+    """根据tasks流中任务开始和结束事件的时间差统计每个节点的耗时"""
+
+    def __init__(self):
+        self.durations: dict[str, list[float]] = {}
+        self.conversations: list[float] = []
+        self.errors = 0
+
+    def record_chunk(self, started: dict[str, float], chunk: dict):
+        now = time.perf_counter()
+        if "result" in chunk or "error" in chunk:
+            start = started.pop(chunk["id"], None)
+            if start is not None:
+                self.durations.setdefault(chunk["name"], []).append(now - start)
+        else:
+            started[chunk["id"]] = now
+
+    def report(self) -> list[str]:
+        lines = [f"{'node':<20}{'count':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}"]
+        rows = sorted(self.durations.items()) + [("conversation", self.conversations)]
+        for node, values in rows:
+            values = sorted(values)
+            lines.append(f"{node:<20}{len(values):>8}" + "".join(
+                f"{percentile(values, q) * 1000:>10.1f}" for q in (50, 95, 99)))
+        return lines
+
+
+def _conversation(rng: random.Random, questions: list[str]):
+    return ({"messages": [HumanMessage(content=rng.choice(questions))]},
+            {"configurable": {"thread_id": str(uuid.uuid4())}})
+
+
+def run_stream(recorder: NodeRecorder, conversations: int, concurrency: int, questions: list[str], seed: int):
+    """同步模式：线程池中执行graph.stream"""
+    rng = random.Random(seed)
+
+    def _one(graph_input, config):
+        started = {}
+        start = time.perf_counter()
+        try:
+            for chunk in director.graph.stream(graph_input, config=config, stream_mode="tasks"):
+                recorder.record_chunk(started, chunk)
+        except Exception:
+            recorder.errors += 1
+            return
+        recorder.conversations.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(_one, *_conversation(rng, questions)) for _ in range(conversations)]
+        for future in futures:
+            future.result()
+
+
+async def run_astream(recorder: NodeRecorder, conversations: int, concurrency: int, questions: list[str], seed: int):
+    """异步模式：单个事件循环中执行graph.astream"""
+    rng = random.Random(seed)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _one(graph_input, config):
+        async with semaphore:
+            started = {}
+            start = time.perf_counter()
+            try:
+                async for chunk in director.graph.astream(graph_input, config=config, stream_mode="tasks"):
+                    recorder.record_chunk(started, chunk)
+            except Exception:
+                recorder.errors += 1
+                return
+            recorder.conversations.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(_one(*_conversation(rng, questions)) for _ in range(conversations)))
+
+
+def parse_weights(raw: str) -> dict[str, float]:
+    weights = {}
+    for item in raw.split(","):
+        label, weight = item.split("=")
+        weights[label.strip()] = float(weight)
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--mode", choices=["stream", "astream"], default="stream")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="假模型平均延迟（秒）")
+    parser.add_argument("--llm-jitter", type=float, default=0.0, help="假模型延迟标准差（秒）")
+    parser.add_argument("--tool-latency", type=float, default=0.02, help="天气桩服务的工具延迟（秒）")
+    parser.add_argument("--weights", default="weather=1,joke=3,couplet=1,other=1", help="supervisor分类分布")
+    parser.add_argument("--no-fast-path", action="store_true", help="关闭本地分类，所有分类都走假模型")
+    parser.add_argument("--tracemalloc", action="store_true", help="统计进程内存分配（开销较大，会降低吞吐）")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # 关闭httpx和MCP每个请求的INFO日志
+    for name in ("httpx", "mcp"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    director.llm = FakeChatModel(latency=args.llm_latency, latency_jitter=args.llm_jitter, seed=args.seed,
+                                 responder=LabelResponder(parse_weights(args.weights), seed=args.seed))
+    # 天气agent使用假模型和本地桩服务
+    stub_url, stub_server = start_stub_weather_server(latency=args.tool_latency)
+    director.weather_agent_cache.model = director.llm
+    director.weather_agent_cache.connections = {"weather": {"url": stub_url, "transport": "sse"}}
+    if args.mode == "stream":
+        director.warmup_weather_agent()
+    if args.no_fast_path:
+        director.intent_classifier.classifiers = []
+
+    recorder = NodeRecorder()
+    saver_before = checkpointer_size(director.checkpointer)
+    if args.tracemalloc:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if args.mode == "stream":
+            run_stream(recorder, args.conversations, args.concurrency, default_questions, args.seed)
+        else:
+            asyncio.run(run_astream(recorder, args.conversations, args.concurrency, default_questions, args.seed))
+    elapsed = time.perf_counter() - start
+    if args.tracemalloc:
+        traced_current, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    saver_after = checkpointer_size(director.checkpointer)
+    stub_server.should_exit = True
+
+    done = len(recorder.conversations)
+    print(f"mode={args.mode} conversations={args.conversations} concurrency={args.concurrency} "
+          f"llm_latency={args.llm_latency}s±{args.llm_jitter}s")
+    print(f"完成：{done}，失败：{recorder.errors}，耗时：{elapsed:.2f}s，吞吐：{done / elapsed:.1f} conversations/s")
+    print("\n".join(recorder.report()))
+    growth = saver_after["bytes"] - saver_before["bytes"]
+    print(f"checkpointer：线程 {saver_before['threads']} -> {saver_after['threads']}，"
+          f"checkpoint {saver_before['checkpoints']} -> {saver_after['checkpoints']}，"
+          f"序列化数据 {saver_before['bytes'] / 1024:.1f}KB -> {saver_after['bytes'] / 1024:.1f}KB"
+          f"（每个会话 {growth / max(done, 1):.0f}B）")
+    if hasattr(director.checkpointer, "stats"):
+        print(f"checkpointer统计：{director.checkpointer.stats()}")
+    for item in tool_metrics.to_json()["tools"]:
+        phases = item["phases"]
+        print(f"MCP工具 {item['server']}.{item['tool']}：调用 {item['calls']}，错误 {item['errors']}，"
+              f"平均耗时 {phases['total']['mean_ms']:.1f}ms（connect {phases['connect']['mean_ms']:.1f}ms，"
+              f"serialize {phases['serialize']['mean_ms']:.1f}ms，execute {phases['execute']['mean_ms']:.1f}ms）")
+    if args.tracemalloc:
+        print(f"tracemalloc：当前 {traced_current / 1024 / 1024:.1f}MB，峰值 {traced_peak / 1024 / 1024:.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
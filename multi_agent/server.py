@@ -0,0 +1,194 @@
+"""
+director图的多会话HTTP服务：
+1. POST /chat 每个请求一个会话（可以传入thread_id继续之前的会话），以SSE的形式返回custom流事件
+2. 限制同时执行的图数量，排队的请求过多时直接返回503（准入控制）
+3. GET /stats 查看运行中/排队/拒绝的请求数以及节点耗时
+4. GET /metrics Prometheus文本格式的MCP工具调用统计
+
+本地压测（使用假模型和天气桩服务，不访问任何模型接口和天气接口）：
+python -m multi_agent.server --fake-llm --port 8080
+curl -N -X POST localhost:8080/chat -d '{"message": "给我讲一个笑话"}'
+"""
+import argparse
+import asyncio
+import json
+import os
+import uuid
+
+import uvicorn
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage
+from sse_starlette.sse import EventSourceResponse
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+# 先加载.env，没有配置模型key时（使用假模型压测）给一个占位值，保证director可以导入
+load_dotenv()
+os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+
+from langgraph_mcp.tool_metrics import tool_metrics
+from multi_agent import director
+
+
+class Overloaded(Exception):
+    """排队请求数超过上限，或者排队超时"""
+
+
+class AdmissionController:
+    """最多max_running个图同时执行，最多max_queued个请求排队，排队超过queue_timeout秒拒绝"""
+
+    def __init__(self, max_running: int = 64, max_queued: int = 256, queue_timeout: float = 5.0):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_running)
+        self.running = 0
+        self.queued = 0
+        self.rejected = 0
+        self.completed = 0
+
+    async def acquire(self):
+        if self._semaphore.locked() and self.queued >= self.max_queued:
+            self.rejected += 1
+            raise Overloaded(f"排队请求数已达上限：{self.max_queued}")
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Overloaded(f"排队超过{self.queue_timeout}秒")
+        finally:
+            self.queued -= 1
+        self.running += 1
+
+    def release(self):
+        self.running -= 1
+        self.completed += 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "max_running": self.max_running,
+            "max_queued": self.max_queued,
+        }
+
+
+admission = AdmissionController()
+
+
+class AdmittedEventSourceResponse(EventSourceResponse):
+    """
+    持有执行名额的SSE响应，响应结束时释放名额。
+    不能在生成器的finally中释放：客户端在开始推流前断开时生成器根本不会执行，名额会永久泄漏
+    """
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+
+async def _stream_session(thread_id: str, message: str):
+    """
+    执行一次会话并把custom流事件转成SSE事件
+    :param thread_id:
+    :param message:
+    :return:
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    try:
+        yield {"event": "session", "data": json.dumps({"thread_id": thread_id})}
+        async for chunk in director.graph.astream({"messages": [HumanMessage(content=message)]},
+                                                  config=config, stream_mode="custom"):
+            yield {"event": "custom", "data": json.dumps(chunk, ensure_ascii=False, default=str)}
+        yield {"event": "end", "data": json.dumps({"thread_id": thread_id})}
+    except Exception as e:
+        yield {"event": "error", "data": json.dumps({"thread_id": thread_id, "error": str(e)}, ensure_ascii=False)}
+
+
+async def chat(request: Request):
+    # 先校验请求体再占用执行名额
+    try:
+        body = await request.json()
+    except (json.JSONDecodeError, ValueError):
+        return JSONResponse({"error": "请求体必须是JSON"}, status_code=400)
+    if not isinstance(body, dict):
+        return JSONResponse({"error": "请求体必须是JSON对象"}, status_code=400)
+    message = body.get("message")
+    if not message or not isinstance(message, str):
+        return JSONResponse({"error": "message不能为空，且必须是字符串"}, status_code=400)
+    thread_id = body.get("thread_id")
+    if thread_id is not None and not isinstance(thread_id, str):
+        return JSONResponse({"error": "thread_id必须是字符串"}, status_code=400)
+    thread_id = thread_id or str(uuid.uuid4())
+    try:
+        await admission.acquire()
+    except Overloaded as e:
+        return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": "1"})
+    return AdmittedEventSourceResponse(_stream_session(thread_id, message), admission.release)
+
+
+async def stats(request: Request):
+    return JSONResponse({
+        "admission": admission.stats(),
+        "node_latency": director.latency_stats.summary(),
+        "intent_classifier": director.intent_classifier.stats(),
+        "checkpointer": director.checkpointer.stats(),
+        "mcp_tools": tool_metrics.to_json()["servers"],
+    })
+
+
+async def health(request: Request):
+    return JSONResponse({"status": "ok"})
+
+
+async def metrics(request: Request):
+    return PlainTextResponse(tool_metrics.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+app = Starlette(routes=[
+    Route("/chat", chat, methods=["POST"]),
+    Route("/stats", stats, methods=["GET"]),
+    Route("/health", health, methods=["GET"]),
+    Route("/metrics", metrics, methods=["GET"]),
+])
+
+
+def main():
+    global admission
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-running", type=int, default=64, help="同时执行的图数量上限")
+    parser.add_argument("--max-queued", type=int, default=256, help="排队请求数上限")
+    parser.add_argument("--queue-timeout", type=float, default=5.0, help="排队超时（秒）")
+    parser.add_argument("--fake-llm", action="store_true", help="使用假模型，用于本地压测")
+    parser.add_argument("--fake-latency", type=float, default=0.05, help="假模型每次调用的延迟（秒）")
+    parser.add_argument("--fake-tool-latency", type=float, default=0.02, help="--fake-llm时天气桩服务的工具延迟（秒）")
+    args = parser.parse_args()
+
+    if args.fake_llm:
+        from multi_agent.fake_llm import FakeChatModel
+        from multi_agent.stub_weather_server import start_stub_weather_server
+        director.llm = FakeChatModel(latency=args.fake_latency)
+        # 天气agent也使用假模型和本地桩服务
+        stub_url, _ = start_stub_weather_server(latency=args.fake_tool_latency)
+        director.weather_agent_cache.model = director.llm
+        director.weather_agent_cache.connections = {"weather": {"url": stub_url, "transport": "sse"}}
+    admission = AdmissionController(args.max_running, args.max_queued, args.queue_timeout)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+推测执行：supervisor调用大模型分类的同时，先执行最可能的专家节点。
+分类结果和猜测一致时直接使用专家节点的结果（省掉一次大模型延迟），不一致时取消猜测的任务。
+"""
+import asyncio
+import threading
+import time
+from collections import Counter, deque
+from typing import Awaitable, Callable, Iterable
+
+from multi_agent.intent_classifier import BaseIntentClassifier
+
+
+class SpeculationPrior:
+    """
+    猜测最可能的分类：优先用本地分类器的最佳结果（即使低于快速通道的阈值），
+    本地分类器没有把握时，用最近window次分类结果中出现最多的分类
+    """
+
+    def __init__(self, classifiers: Iterable[BaseIntentClassifier], min_confidence: float = 0.3, window: int = 200):
+        self.classifiers = list(classifiers)
+        self.min_confidence = min_confidence
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def guess(self, text: str) -> str | None:
+        best_label, best_confidence = None, 0.0
+        for classifier in self.classifiers:
+            label, confidence = classifier.classify(text)
+            if label is not None and confidence > best_confidence:
+                best_label, best_confidence = label, confidence
+        if best_label is not None and best_confidence >= self.min_confidence:
+            return best_label
+        with self._lock:
+            if not self._recent:
+                return None
+            return Counter(self._recent).most_common(1)[0][0]
+
+    def observe(self, label: str):
+        """记录一次实际的分类结果"""
+        with self._lock:
+            self._recent.append(label)
+
+
+class BufferedWriter:
+    """推测执行时先缓存专家节点的custom流事件，猜对了再输出，猜错了直接丢弃"""
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, chunk):
+        self.events.append(chunk)
+
+    def flush(self, writer):
+        for chunk in self.events:
+            writer(chunk)
+        self.events.clear()
+
+
+class SpeculationStats:
+    """推测执行的命中率，以及猜对时节省的延迟、猜错时浪费的执行时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.wasted_seconds = 0.0
+
+    def record(self, hit: bool, classify_seconds: float, specialist_seconds: float):
+        """
+        :param hit: 是否猜对
+        :param classify_seconds: 大模型分类耗时
+        :param specialist_seconds: 猜测的专家节点耗时（猜错时为被取消前已经执行的时间）
+        :return:
+        """
+        with self._lock:
+            self.attempts += 1
+            if hit:
+                self.hits += 1
+                # 串行耗时是两者之和，并行后是两者的最大值，节省的就是较小的那个
+                self.saved_seconds += min(classify_seconds, specialist_seconds)
+            else:
+                self.misses += 1
+                self.wasted_seconds += specialist_seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "attempts": self.attempts,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / self.attempts if self.attempts else 0.0,
+                "saved_ms_total": self.saved_seconds * 1000,
+                "saved_ms_per_hit": self.saved_seconds / self.hits * 1000 if self.hits else 0.0,
+                "wasted_ms_total": self.wasted_seconds * 1000,
+            }
+
+
+class TimedTask:
+    """后台执行专家节点并记录耗时，被取消时也能拿到已经执行的时间"""
+
+    def __init__(self, coro: Awaitable):
+        self.start = time.perf_counter()
+        self.end: float | None = None
+        self.task = asyncio.ensure_future(self._run(coro))
+
+    async def _run(self, coro: Awaitable):
+        try:
+            return await coro
+        finally:
+            self.end = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    async def result(self):
+        return await self.task
+
+    async def cancel(self) -> float:
+        """
+        取消任务并等待退出
+        :return: 被取消前已经执行的时间
+        """
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        return self.elapsed
+
+
+# 专家节点的推测执行函数：fn(推测的state, writer) -> 节点返回值
+SpecialistFunc = Callable[[dict, Callable], Awaitable[dict]]
@@ -0,0 +1,89 @@
+"""
+节点流式输出的耗时统计：首token时间（TTFT）和总耗时
+"""
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+# hook签名：hook(节点名称, 首token耗时秒数（没有输出时为None）, 总耗时秒数)
+LatencyHook = Callable[[str, float | None, float], None]
+
+
+class NodeTimer:
+    """记录一次节点执行的TTFT和总耗时，结束时依次调用hooks"""
+
+    def __init__(self, node: str, hooks: list[LatencyHook]):
+        self.node = node
+        self.hooks = hooks
+        self.start = time.perf_counter()
+        self.ttft: float | None = None
+
+    def token(self):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start
+
+    def finish(self) -> float:
+        total = time.perf_counter() - self.start
+        for hook in self.hooks:
+            hook(self.node, self.ttft, total)
+        return total
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    最近秩法计算分位数
+    :param values: 已排序的数值
+    :param q: 0~100
+    :return:
+    """
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+class LatencyStats:
+    """
+    按节点汇总TTFT和总耗时，可以直接作为hook使用。
+    长时间运行的服务中每个节点只保留最近window个样本计算分位数，count是所有样本数
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self.ttft: dict[str, deque[float]] = {}
+        self.total: dict[str, deque[float]] = {}
+        self.counts: dict[str, int] = {}
+
+    def __call__(self, node: str, ttft: float | None, total: float):
+        with self._lock:
+            if ttft is not None:
+                self.ttft.setdefault(node, deque(maxlen=self.window)).append(ttft)
+            self.total.setdefault(node, deque(maxlen=self.window)).append(total)
+            self.counts[node] = self.counts.get(node, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self.ttft.clear()
+            self.total.clear()
+            self.counts.clear()
+
+    def summary(self) -> dict[str, dict]:
+        """
+        :return: {节点: {"count", "ttft_p50_ms", "ttft_p95_ms", "total_p50_ms", "total_p95_ms"}}，分位数按最近window个样本计算
+        """
+        with self._lock:
+            result = {}
+            for node, totals in self.total.items():
+                ttfts = sorted(self.ttft.get(node, ()))
+                totals = sorted(totals)
+                result[node] = {
+                    "count": self.counts[node],
+                    "ttft_p50_ms": percentile(ttfts, 50) * 1000,
+                    "ttft_p95_ms": percentile(ttfts, 95) * 1000,
+                    "total_p50_ms": percentile(totals, 50) * 1000,
+                    "total_p95_ms": percentile(totals, 95) * 1000,
+                }
+            return result
@@ -0,0 +1,47 @@
+"""
+本地的天气MCP桩服务，替代dashscope的天气MCP，用于压测：
+get_weather工具按配置的延迟返回固定的天气
+"""
+import asyncio
+import threading
+import time
+
+import uvicorn
+from mcp.server import FastMCP
+
+
+def build_stub_weather_server(latency: float = 0.02) -> FastMCP:
+    """
+    :param latency: 工具执行延迟（秒）
+    :return:
+    """
+    mcp = FastMCP("stub_weather")
+
+    @mcp.tool()
+    async def get_weather(city: str) -> str:
+        """
+        查询城市的天气
+        :param city: 城市名称
+        :return:
+        """
+        await asyncio.sleep(latency)
+        return f"{city}：晴，25℃，东南风2级"
+
+    return mcp
+
+
+def start_stub_weather_server(latency: float = 0.02, host: str = "127.0.0.1", port: int = 0) -> tuple[str, uvicorn.Server]:
+    """
+    在后台线程中以SSE方式启动桩服务
+    :param latency: 工具执行延迟（秒）
+    :param host:
+    :param port: 0表示随机端口
+    :return: (SSE地址, uvicorn服务，调用server.should_exit = True停止)
+    """
+    app = build_stub_weather_server(latency).sse_app()
+    server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="stub-weather-server", daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return f"http://{host}:{port}/sse", server
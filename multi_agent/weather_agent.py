@@ -0,0 +1,281 @@
+"""
+天气agent的长连接缓存：
+1. MCP客户端只在第一次使用时建立连接，之后复用同一个session和工具列表
+2. 按照工具schema的版本缓存编译好的react agent，工具不变就不重新编译，重新连接后重新编译（工具绑定在旧session上）
+3. 连接出错时自动重连（只有连接错误才重连，模型报错等其他错误直接抛出），可以在服务启动时预热
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Sequence
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.tools import BaseTool
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from langchain_mcp_adapters.tools import load_mcp_tools
+from langgraph.prebuilt import create_react_agent
+
+from langgraph_mcp.session_pool import is_connection_error
+from langgraph_mcp.tool_metrics import InstrumentedSession, instrument_tools
+
+
+def tool_schema_version(tools: Sequence[BaseTool]) -> str:
+    """
+    根据工具的名称、描述和参数schema计算版本号
+    :param tools:
+    :return: 版本号（sha1摘要）
+    """
+    schemas = []
+    for tool in tools:
+        args_schema = tool.args_schema
+        if args_schema is not None and not isinstance(args_schema, dict):
+            args_schema = args_schema.model_json_schema()
+        schemas.append({"name": tool.name, "description": tool.description, "args": args_schema})
+    schemas.sort(key=lambda item: item["name"])
+    raw = json.dumps(schemas, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class WeatherAgentCache:
+    """长连接的天气MCP客户端，以及按工具schema版本缓存的天气agent"""
+
+    def __init__(self, model: BaseChatModel, connections: dict[str, Any], server_name: str = "weather",
+                 prompt: str = "你是一个专业的天气预报专家，请根据用户问题给出天气预报。", max_retries: int = 1):
+        self.model = model
+        self.connections = connections
+        self.server_name = server_name
+        self.prompt = prompt
+        self.max_retries = max_retries
+        self.tools: list[BaseTool] = []
+        self.schema_version: str | None = None
+        # (schema版本, 连接次数) -> 已编译的agent，工具绑定在建立连接时的session上，重连后不能再用
+        self._agents: dict[tuple[str, int], Any] = {}
+        self._runner: asyncio.Task | None = None
+        self._closing: asyncio.Event | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._lock: asyncio.Lock | None = None
+        self.connect_count = 0
+
+    @property
+    def started(self) -> bool:
+        return self._runner is not None and not self._runner.done()
+
+    async def _session_runner(self, ready: asyncio.Future):
+        """
+        session必须在同一个task里进入和退出，所以单独用一个task持有连接，直到被关闭
+        :param ready: 连接建立后把工具列表写进去
+        :return:
+        """
+        client = MultiServerMCPClient(self.connections)
+        try:
+            async with client.session(self.server_name) as session:
+                # 工具调用耗时记录在tool_metrics中
+                tools = instrument_tools(await load_mcp_tools(InstrumentedSession(session)), self.server_name)
+                ready.set_result(tools)
+                await self._closing.wait()
+        except BaseException as e:
+            if not ready.done():
+                ready.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+
+    async def start(self) -> list[BaseTool]:
+        """
+        懒加载：第一次调用时建立连接并获取工具，之后直接返回缓存的工具
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # session和事件循环绑定，换了事件循环只能丢弃旧连接重新建立
+            self._discard()
+            self._loop = loop
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.started:
+                return self.tools
+            return await self._connect()
+
+    async def _connect(self) -> list[BaseTool]:
+        """建立新连接，调用方需要持有self._lock"""
+        loop = asyncio.get_running_loop()
+        self._closing = asyncio.Event()
+        ready = loop.create_future()
+        self._runner = loop.create_task(self._session_runner(ready))
+        self.tools = await ready
+        self.schema_version = tool_schema_version(self.tools)
+        self.connect_count += 1
+        # 旧连接上编译的agent都已失效
+        self._agents.clear()
+        return self.tools
+
+    async def get_agent(self):
+        """
+        获取当前工具schema版本对应的agent，没有就编译一个
+        :return:
+        """
+        tools = await self.start()
+        key = (self.schema_version, self.connect_count)
+        agent = self._agents.get(key)
+        if agent is None:
+            agent = create_react_agent(model=self.model, tools=tools, prompt=self.prompt)
+            self._agents[key] = agent
+        return agent
+
+    async def astream(self, messages: list, **kwargs):
+        """
+        调用天气agent，连接断开时重连后重试
+        :param messages:
+        :param kwargs: 透传给agent.astream
+        :return:
+        """
+        attempt = 0
+        while True:
+            agent = await self.get_agent()
+            # 记录使用的是第几次建立的连接，并发的请求同时发现连接断开时只重连一次
+            generation = self.connect_count
+            emitted = False
+            try:
+                async for chunk in agent.astream({"messages": messages}, **kwargs):
+                    emitted = True
+                    yield chunk
+                return
+            except Exception as e:
+                # 只有连接错误才重连：模型报错（例如429）时重连会断开其他并发请求正在使用的连接。
+                # 已经输出过内容就不能再重试，否则下游会收到重复的chunk
+                if not is_connection_error(e) or emitted or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                await self.reconnect(generation)
+
+    async def reconnect(self, generation: int | None = None) -> list[BaseTool]:
+        """
+        关闭旧连接并重新建立
+        :param generation: 发现连接断开时使用的连接序号（connect_count），已经被其他请求重连过时不再重连
+        :return:
+        """
+        await self.start()
+        async with self._lock:
+            if generation is not None and generation != self.connect_count and self.started:
+                return self.tools
+            await self._close()
+            return await self._connect()
+
+    async def aclose(self):
+        """
+        关闭连接，已编译的agent在下次建立连接时丢弃
+        :return:
+        """
+        if self._lock is None or self._loop is not asyncio.get_running_loop():
+            self._runner = None
+            return
+        async with self._lock:
+            await self._close()
+
+    async def _close(self):
+        """关闭当前连接，调用方需要持有self._lock"""
+        runner = self._runner
+        if runner is None:
+            return
+        self._closing.set()
+        await asyncio.gather(runner, return_exceptions=True)
+        self._runner = None
+
+    def _discard(self):
+        """丢弃其他事件循环上的连接"""
+        if self._runner is not None and self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._closing.set)
+        self._runner = None
+
+    def warmup(self):
+        """
+        同步预热：在后台事件循环中建立连接并编译agent
+        :return:
+        """
+        return run_in_background_loop(self.get_agent())
+
+
+_background_loop: asyncio.AbstractEventLoop | None = None
+_background_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """
+    同步节点共用的后台事件循环，避免每次调用都asyncio.run创建新的事件循环导致长连接失效
+    :return:
+    """
+    global _background_loop
+    with _background_lock:
+        if _background_loop is None or _background_loop.is_closed():
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(target=_background_loop.run_forever, name="mcp-background-loop",
+                             daemon=True).start()
+        return _background_loop
+
+
+def run_in_background_loop(coro, timeout: float | None = None):
+    """
+    在后台事件循环中执行协程，并同步等待结果
+    :param coro:
+    :param timeout:
+    :return:
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_background_loop())
+    return future.result(timeout)
+
+
+if __name__ == "__main__":
+    # 自检：两个并发请求中一个遇到模型错误时，不重连、不影响另一个正在调用工具的请求；
+    # 并发的请求同时发现同一个连接断开时只重连一次
+    # python -m multi_agent.weather_agent
+    import logging
+
+    from langchain_core.messages import HumanMessage
+
+    from multi_agent.fake_llm import FakeChatModel
+    from multi_agent.stub_weather_server import start_stub_weather_server
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logging.getLogger("mcp").setLevel(logging.WARNING)
+
+    class RateLimitedModel(FakeChatModel):
+        """问题中包含fail时模拟模型接口返回429"""
+
+        def _check(self, messages):
+            if "fail" in str(messages[-1].content):
+                raise RuntimeError("LLM 429 rate limited")
+
+        async def _agenerate(self, messages, *args, **kwargs):
+            self._check(messages)
+            return await super()._agenerate(messages, *args, **kwargs)
+
+        async def _astream(self, messages, *args, **kwargs):
+            self._check(messages)
+            async for chunk in super()._astream(messages, *args, **kwargs):
+                yield chunk
+
+    async def _check_model_error():
+        stub_url, stub_server = start_stub_weather_server(latency=0.5)
+        cache = WeatherAgentCache(RateLimitedModel(latency=0.05), {"weather": {"url": stub_url, "transport": "sse"}})
+        await cache.start()
+
+        async def _run(text: str):
+            return [chunk async for chunk in cache.astream([HumanMessage(content=text)])]
+
+        ok, failed = await asyncio.wait_for(
+            asyncio.gather(_run("深圳天气怎么样"), _run("fail"), return_exceptions=True), timeout=10)
+        assert isinstance(failed, RuntimeError), failed
+        assert not isinstance(ok, BaseException) and any("tools" in chunk for chunk in ok), ok
+        assert cache.connect_count == 1, cache.connect_count
+        print(f"模型错误：失败的请求直接抛出（{failed}），另一个请求正常完成，connect_count={cache.connect_count}")
+
+        # 三个请求同时发现第1个连接断开，只重连一次
+        await asyncio.gather(*(cache.reconnect(generation=1) for _ in range(3)))
+        assert cache.connect_count == 2, cache.connect_count
+        ok = await asyncio.wait_for(_run("北京天气怎么样"), timeout=10)
+        assert any("tools" in chunk for chunk in ok), ok
+        print(f"并发重连：connect_count={cache.connect_count}，重连后的请求正常完成")
+        await cache.aclose()
+        stub_server.should_exit = True
+
+    asyncio.run(_check_model_error())